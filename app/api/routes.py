@@ -2,16 +2,24 @@
 Definição das rotas da API
 """
 
+import json
 import logging
+import time
 from datetime import datetime
+from itertools import islice
 from typing import Dict, Any
 
-from flask import Flask, render_template, Response, jsonify, request
+from flask import Flask, g, render_template, Response, jsonify, request, stream_with_context
 from flask_limiter import Limiter
 
-from services.tor_service import TorService
+from services.tor_service import SNAPSHOT_RETRY_AFTER_SECONDS, SnapshotUnavailableError, TorService
 from services.url_service import UrlService
-from utils.validators import validate_country_code
+from services.feed_service import FeedService, CursorExpiredError
+from services.node_query import NodeQuery
+from config.settings import Config
+from utils.metrics import REGISTRY, REQUEST_DURATION, STALE_RESPONSES
+from utils.validators import validate_country_code, normalize_ip_address
+from utils.streams import iter_request_lines, parse_ip_line
 from utils.formatters import (
     format_exit_nodes_text,
     format_rss_feed,
@@ -19,15 +27,74 @@ from utils.formatters import (
 )
 
 
-def create_routes(app: Flask, tor_service: TorService, url_service: UrlService, limiter: Limiter) -> None:
+def create_routes(
+    app: Flask,
+    tor_service: TorService,
+    url_service: UrlService,
+    feed_service: FeedService,
+    limiter: Limiter
+) -> None:
     """Cria e registra todas as rotas da aplicação"""
     
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        REGISTRY.start_flusher()
+
+    @app.after_request
+    def observe_request_duration(response):
+        """Latência por rota (padrão da URL, não o caminho, para limitar as séries).
+
+        Em respostas em streaming mede até o início do envio do corpo.
+        """
+        start = g.pop('request_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start, route, request.method, str(response.status_code)
+            )
+        return response
+
+    @app.before_request
+    def reset_stale_sources():
+        tor_service.take_stale_sources()
+
+    @app.after_request
+    def mark_stale_response(response):
+        """Sinaliza respostas servidas de snapshot vencido (atualização já agendada)."""
+        stale = tor_service.take_stale_sources()
+        if stale:
+            response.headers['X-Stale-Sources'] = ','.join(sorted(stale))
+            for source in stale:
+                STALE_RESPONSES.inc(source)
+        return response
+
+    def snapshot_unavailable(error: SnapshotUnavailableError):
+        """503 com Retry-After enquanto a fonte não tem nenhum snapshot"""
+        response = jsonify({'status': 'error', 'error': str(error)})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response
+
+    def exit_feed_unavailable(retry_after: int):
+        """Marcador de indisponibilidade do feed de IPs, com 503 para não ser lido como lista vazia"""
+        content = format_exit_nodes_text([], None, unavailable=True)
+        response = Response(content, status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
     @app.route('/health')
     @limiter.exempt
     def health():
         """Healthcheck leve para orquestradores (Docker/Kubernetes)."""
         return jsonify({'status': 'ok'}), 200
 
+    @app.route('/metrics')
+    @limiter.exempt
+    def metrics():
+        """Métricas no formato do Prometheus, somadas entre os workers."""
+        return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
     @app.route('/robots.txt')
     @limiter.exempt
     def robots_txt():
@@ -62,12 +129,13 @@ def create_routes(app: Flask, tor_service: TorService, url_service: UrlService,
         try:
             exit_cache_info = tor_service.cache_service.get_exit_cache_info()
             detailed_cache_info = tor_service.cache_service.get_detailed_cache_info()
+            statistics = tor_service.get_statistics()
             
             stats = {
                 'ip_count': exit_cache_info.item_count,
                 'total_detailed_nodes': detailed_cache_info.item_count,
-                'running_nodes': len(tor_service.get_running_nodes()),
-                'exit_nodes': len(tor_service.get_exit_nodes_detailed()),
+                'running_nodes': statistics['running_nodes'],
+                'exit_nodes': statistics['exit_nodes'],
                 'cache_exists': exit_cache_info.exists,
                 'detailed_cache_exists': detailed_cache_info.exists,
                 'last_update': exit_cache_info.last_update,
@@ -85,14 +153,43 @@ def create_routes(app: Flask, tor_service: TorService, url_service: UrlService,
     def tornodes_ip():
         """Endpoint principal que retorna os IPs dos nós Tor em formato texto"""
         try:
-            ips = tor_service.get_exit_nodes()
-            cache_info = tor_service.cache_service.get_exit_cache_info()
-            content = format_exit_nodes_text(ips, cache_info.last_update)
+            body = feed_service.get('exit_ips')
+        except SnapshotUnavailableError as e:
+            return exit_feed_unavailable(e.retry_after)
         except Exception:
             logging.exception("Erro ao buscar tornodes-ip.txt")
-            content = format_exit_nodes_text([], None, unavailable=True)
-        return Response(content, mimetype='text/plain')
+            return exit_feed_unavailable(SNAPSHOT_RETRY_AFTER_SECONDS)
+        return body.to_response(request.headers.get('Accept-Encoding'))
 
+    @app.route('/api/exit-nodes/diff')
+    @limiter.limit("60 per minute")
+    def exit_nodes_diff():
+        """IPs exit adicionados/removidos desde a versão ``since``.
+        
+        Sem ``since``, ou com uma versão que o log já não cobre, devolve a
+        lista completa (``full: true``) e a versão atual para as próximas
+        consultas.
+        """
+        since = request.args.get('since', type=int)
+        if 'since' in request.args and (since is None or since < 0):
+            return jsonify({
+                'status': 'error',
+                'error': 'since deve ser um número inteiro não negativo'
+            }), 400
+        
+        try:
+            diff = tor_service.get_exit_diff(since)
+            return jsonify({'status': 'success', **diff})
+            
+        except SnapshotUnavailableError as e:
+            return snapshot_unavailable(e)
+        except Exception as e:
+            logging.error(f"Erro ao calcular diff dos nós exit: {e}")
+            return jsonify({
+                'status': 'error',
+                'error': str(e)
+            }), 500
+    
     @app.route('/honeypot-urls.txt')
     @limiter.limit("30 per minute")
     def honeypot_urls():
@@ -100,14 +197,15 @@ def create_routes(app: Flask, tor_service: TorService, url_service: UrlService,
 
         O serviço de URLs já degrada graciosamente (retorna lista vazia quando o
         banco está indisponível), então não há vazamento de erro de conexão aqui.
+        O texto vem pronto do cache em memória do serviço.
         """
         try:
-            urls, last_update = url_service.get_recent_urls()
-            content = format_url_list_text(urls, last_update)
+            body = url_service.get_feed().body
         except Exception:
             logging.exception("Erro inesperado ao buscar honeypot-urls.txt")
             content = format_url_list_text([], None, unavailable=True)
-        return Response(content, mimetype='text/plain')
+            return Response(content, mimetype='text/plain')
+        return body.to_response(request.headers.get('Accept-Encoding'))
 
     @app.route('/status')
     @limiter.limit("60 per minute")
@@ -129,6 +227,7 @@ def create_routes(app: Flask, tor_service: TorService, url_service: UrlService,
                 'detailed_last_update': detailed_cache_info.last_update.isoformat() 
                 if detailed_cache_info.last_update else None,
                 'total_detailed_nodes': detailed_cache_info.item_count,
+                'sources': tor_service.get_source_status(),
                 'current_time': datetime.utcnow().isoformat()
             }
             
@@ -146,21 +245,76 @@ def create_routes(app: Flask, tor_service: TorService, url_service: UrlService,
     @app.route('/api/nodes')
     @limiter.limit("20 per minute")
     def get_all_nodes():
-        """Retorna todos os nós Tor detalhados"""
+        """Retorna os nós Tor detalhados.
+        
+        Sem parâmetros, devolve o corpo completo pré-comprimido. Com ``limit``,
+        ``cursor`` e/ou ``fields`` (lista separada por vírgulas), devolve uma
+        página projetada em streaming, com ``next_cursor`` para a seguinte.
+        """
+        if request.args.keys() & {'limit', 'cursor', 'fields'}:
+            return _stream_nodes_page()
+        
         try:
-            nodes = tor_service.get_detailed_nodes()
-            cache_info = tor_service.cache_service.get_detailed_cache_info()
+            body = feed_service.get('nodes')
+            return body.to_response(request.headers.get('Accept-Encoding'))
             
+        except SnapshotUnavailableError as e:
+            return snapshot_unavailable(e)
+        except Exception as e:
+            logging.error(f"Erro ao buscar todos os nós: {e}")
             return jsonify({
-                'status': 'success',
-                'total_nodes': len(nodes),
-                'last_updated': cache_info.last_update.isoformat() 
-                if cache_info.last_update else None,
-                'nodes': nodes
-            })
+                'status': 'error',
+                'error': str(e)
+            }), 500
+    
+    def _stream_nodes_page():
+        try:
+            limit = request.args.get('limit', type=int)
+            if 'limit' in request.args and limit is None:
+                raise ValueError("limit deve ser um número inteiro")
             
+            fields = None
+            if 'fields' in request.args:
+                fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+                if not fields:
+                    raise ValueError("fields não pode ser vazio")
+            
+            chunks = feed_service.stream_nodes(limit, request.args.get('cursor'), fields)
+            
+        except SnapshotUnavailableError as e:
+            return snapshot_unavailable(e)
+        except CursorExpiredError as e:
+            return jsonify({'status': 'error', 'error': str(e)}), 410
+        except ValueError as e:
+            return jsonify({'status': 'error', 'error': str(e)}), 400
         except Exception as e:
-            logging.error(f"Erro ao buscar todos os nós: {e}")
+            logging.error(f"Erro ao paginar nós: {e}")
+            return jsonify({
+                'status': 'error',
+                'error': str(e)
+            }), 500
+        
+        return Response(chunks, mimetype='application/json')
+    
+    @app.route('/api/nodes/query')
+    @limiter.limit("60 per minute")
+    def query_nodes():
+        """Filtros combinados: country, flag, as_name, faixa de bandwidth e de first_seen"""
+        try:
+            query = NodeQuery.from_args(request.args)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'error': str(e)}), 400
+        
+        try:
+            body = feed_service.query(query)
+            return body.to_response(request.headers.get('Accept-Encoding'))
+            
+        except SnapshotUnavailableError as e:
+            return snapshot_unavailable(e)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'error': str(e)}), 400
+        except Exception as e:
+            logging.error(f"Erro ao consultar nós: {e}")
             return jsonify({
                 'status': 'error',
                 'error': str(e)
@@ -171,17 +325,11 @@ def create_routes(app: Flask, tor_service: TorService, url_service: UrlService,
     def get_running_nodes():
         """Retorna apenas os nós Tor ativos"""
         try:
-            running_nodes = tor_service.get_running_nodes()
-            cache_info = tor_service.cache_service.get_detailed_cache_info()
-            
-            return jsonify({
-                'status': 'success',
-                'total_running_nodes': len(running_nodes),
-                'last_updated': cache_info.last_update.isoformat() 
-                if cache_info.last_update else None,
-                'nodes': running_nodes
-            })
+            body = feed_service.get('running')
+            return body.to_response(request.headers.get('Accept-Encoding'))
             
+        except SnapshotUnavailableError as e:
+            return snapshot_unavailable(e)
         except Exception as e:
             logging.error(f"Erro ao buscar nós ativos: {e}")
             return jsonify({
@@ -195,26 +343,94 @@ def create_routes(app: Flask, tor_service: TorService, url_service: UrlService,
     def get_detailed_stats():
         """Retorna estatísticas detalhadas dos nós Tor"""
         try:
-            statistics = tor_service.get_statistics()
+            body = feed_service.get('stats')
+            return body.to_response(request.headers.get('Accept-Encoding'))
+            
+        except SnapshotUnavailableError as e:
+            return snapshot_unavailable(e)
+        except Exception as e:
+            logging.error(f"Erro ao buscar estatísticas: {e}")
+            return jsonify({
+                'status': 'error',
+                'error': str(e)
+            }), 500
+    
+    @app.route('/api/check/<path:ip>')
+    @limiter.limit("120 per minute")
+    def check_exit_ip(ip):
+        """Indica se um IP é nó Tor exit, sem baixar a lista completa"""
+        address = normalize_ip_address(ip)
+        if address is None:
+            return jsonify({
+                'status': 'error',
+                'error': 'Endereço IP inválido'
+            }), 400
+        
+        try:
+            is_exit, last_seen = tor_service.lookup_exit_ip(address)
+            timestamp = tor_service.cache_service.get_exit_cache_timestamp()
             
             return jsonify({
                 'status': 'success',
-                'statistics': statistics
+                'ip': address,
+                'is_tor_exit': is_exit,
+                'last_seen': last_seen.isoformat() if last_seen else None,
+                'last_updated': datetime.utcfromtimestamp(timestamp).isoformat() 
+                if timestamp is not None else None
             })
             
+        except SnapshotUnavailableError as e:
+            return snapshot_unavailable(e)
         except Exception as e:
-            logging.error(f"Erro ao buscar estatísticas: {e}")
+            logging.error(f"Erro ao consultar IP exit: {e}")
             return jsonify({
                 'status': 'error',
                 'error': str(e)
             }), 500
     
+    @app.route('/api/check', methods=['POST'])
+    @limiter.limit("10 per minute")
+    def bulk_check_ips():
+        """Enriquece IPs em lote (texto ou NDJSON) e devolve NDJSON em streaming.
+        
+        O corpo é lido linha a linha e as respostas saem em blocos, então a
+        memória do worker não cresce com o tamanho do lote.
+        """
+        max_ips = Config.BULK_CHECK_MAX_IPS
+        batch_size = Config.BULK_CHECK_BATCH_SIZE
+        
+        # Sem a lista de exits ou o snapshot de relays, todo IP sairia como
+        # "não é exit"/"não é relay"
+        try:
+            tor_service.require_snapshot('exit_addresses')
+            tor_service.require_snapshot('onionoo')
+        except SnapshotUnavailableError as e:
+            return snapshot_unavailable(e)
+        
+        def generate():
+            lines = iter_request_lines(request.stream)
+            ips = (ip for ip in map(parse_ip_line, lines) if ip)
+            
+            batch = []
+            for result in tor_service.enrich_ips(islice(ips, max_ips)):
+                batch.append(json.dumps(result, separators=(',', ':')))
+                if len(batch) >= batch_size:
+                    yield '\n'.join(batch) + '\n'
+                    batch = []
+            
+            if next(ips, None) is not None:
+                batch.append(json.dumps({'error': 'limit_exceeded', 'max_ips': max_ips}))
+            if batch:
+                yield '\n'.join(batch) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
     @app.route('/api/feed/rss')
     @limiter.limit("10 per minute")
     def get_rss_feed():
         """Retorna feed RSS dos nós Tor"""
         try:
-            nodes = tor_service.get_detailed_nodes()[:20]  # Primeiros 20 nós
+            nodes = tor_service.get_detailed_nodes(limit=20)  # Primeiros 20 nós
             cache_info = tor_service.cache_service.get_detailed_cache_info()
             
             rss_content = format_rss_feed(nodes, cache_info.last_update)
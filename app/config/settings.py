@@ -24,11 +24,43 @@ class Config:
     REQUEST_TIMEOUT: int = int(os.getenv('REQUEST_TIMEOUT', 30))
     MAX_RETRIES: int = int(os.getenv('MAX_RETRIES', 3))
     
+    # Circuit breaker das fontes: falhas seguidas até suspender e espera inicial (s)
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 3))
+    CIRCUIT_RESET_SECONDS: int = int(os.getenv('CIRCUIT_RESET_SECONDS', 60))
+    
+    # Versões da lista de exits mantidas no log de deltas (/api/exit-nodes/diff)
+    EXIT_DIFF_LOG_SIZE: int = int(os.getenv('EXIT_DIFF_LOG_SIZE', 500))
+    
+    # Fontes upstream (sobrescrevíveis para espelhos ou o upstream falso dos benchmarks)
+    ONIONOO_URL: str = os.getenv('ONIONOO_URL', 'https://onionoo.torproject.org').rstrip('/')
+    EXIT_ADDRESSES_URL: str = os.getenv('EXIT_ADDRESSES_URL', 'https://check.torproject.org/exit-addresses')
+    
+    # Onionoo: /details traz políticas de saída e pesos, mas é bem maior que /summary
+    ONIONOO_DETAILS: bool = os.getenv('ONIONOO_DETAILS', 'False').lower() == 'true'
+    ONIONOO_DETAILS_FIELDS: str = (
+        'nickname,fingerprint,or_addresses,exit_addresses,running,flags,'
+        'advertised_bandwidth,country,as_name,first_seen,last_seen,'
+        'consensus_weight,exit_policy_summary'
+    )
+    
+    # Enriquecimento em lote (POST /api/check)
+    BULK_CHECK_MAX_IPS: int = int(os.getenv('BULK_CHECK_MAX_IPS', 100000))
+    BULK_CHECK_BATCH_SIZE: int = int(os.getenv('BULK_CHECK_BATCH_SIZE', 1000))
+    
+    # Consultas combinadas (/api/nodes/query): resultados mantidos em LRU
+    NODE_QUERY_CACHE_SIZE: int = int(os.getenv('NODE_QUERY_CACHE_SIZE', 128))
+    
+    # Métricas (/metrics): intervalo em que cada worker publica seus valores
+    METRICS_FLUSH_SECONDS: float = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+    
     # Logging
     LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO')
     
-    # Rate Limiting
-    RATE_LIMIT_STORAGE: str = os.getenv('RATE_LIMIT_STORAGE', 'memory://')
+    # Rate Limiting: por padrão, SQLite em CACHE_DIR (contadores compartilhados entre workers)
+    RATE_LIMIT_STORAGE: str = os.getenv('RATE_LIMIT_STORAGE', '')
+    RATE_LIMIT_STRATEGY: str = os.getenv('RATE_LIMIT_STRATEGY', 'fixed-window')
+    # Lido pelo Flask-Limiter; desligar só em benchmarks e testes de carga
+    RATELIMIT_ENABLED: bool = os.getenv('RATELIMIT_ENABLED', 'True').lower() == 'true'
 
     # Paths
     CACHE_DIR: str = os.getenv('CACHE_DIR', '/tmp')
@@ -39,23 +71,55 @@ class Config:
     DB_USER: str = os.getenv('DB_USER', 'root')
     DB_PASSWORD: str = os.getenv('DB_PASSWORD', '')
     DB_NAME: str = os.getenv('DB_NAME', '')
+    DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', 4))
+    HONEYPOT_CACHE_TTL_SECONDS: int = int(os.getenv('HONEYPOT_CACHE_TTL_SECONDS', 60))
+    HONEYPOT_FULL_SYNC_MINUTES: int = int(os.getenv('HONEYPOT_FULL_SYNC_MINUTES', 1440))
     LEGIT_DOMAINS: List[str] = [d.strip() for d in os.getenv('LEGIT_DOMAINS', '').split(',') if d.strip()]
+    LEGIT_DOMAINS_FILE: str = os.getenv('LEGIT_DOMAINS_FILE', '')
     
     @classmethod
     def get_cache_paths(cls) -> Dict[str, str]:
         """Retorna os caminhos dos arquivos de cache"""
         return {
-            'exit_cache': f"{cls.CACHE_DIR}/tor_exit_cache.txt",
-            'exit_timestamp': f"{cls.CACHE_DIR}/tor_exit_timestamp.txt",
-            'detailed_cache': f"{cls.CACHE_DIR}/tor_exit_cache_detailed.txt"
+            'exit_cache': f"{cls.CACHE_DIR}/tor_exit_cache.json",
+            'detailed_snapshot': f"{cls.CACHE_DIR}/tor_nodes.snap",
+            'detailed_feeds': f"{cls.CACHE_DIR}/tor_nodes.feeds",
+            'rate_limit': f"{cls.CACHE_DIR}/tor_ratelimit.db",
+            'metrics': f"{cls.CACHE_DIR}/tor_metrics"
         }
     
+    @classmethod
+    def get_rate_limit_storage(cls) -> str:
+        """URI do storage do rate limit (``RATE_LIMIT_STORAGE`` ou SQLite local)"""
+        return cls.RATE_LIMIT_STORAGE or f"sqlite://{cls.get_cache_paths()['rate_limit']}"
+    
     @classmethod
     def get_tor_sources(cls) -> Dict[str, str]:
         """Retorna as URLs das fontes de dados Tor"""
+        if cls.ONIONOO_DETAILS:
+            # Pede só os campos usados, para reduzir o download
+            onionoo = f"{cls.ONIONOO_URL}/details?fields={cls.ONIONOO_DETAILS_FIELDS}"
+        else:
+            onionoo = f"{cls.ONIONOO_URL}/summary"
+        
+        return {
+            'onionoo': onionoo,
+            'exit_addresses': cls.EXIT_ADDRESSES_URL
+        }
+    
+    @classmethod
+    def get_tor_source_settings(cls) -> Dict[str, Dict[str, int]]:
+        """Intervalo de verificação e timeout (segundos) de cada fonte.
+        
+        Sobrescrevíveis por fonte via ``<FONTE>_CHECK_INTERVAL`` e
+        ``<FONTE>_TIMEOUT`` (ex.: ``ONIONOO_TIMEOUT``).
+        """
         return {
-            'onionoo': 'https://onionoo.torproject.org/summary',
-            'exit_addresses': 'https://check.torproject.org/exit-addresses'
+            source: {
+                'interval': int(os.getenv(f'{source.upper()}_CHECK_INTERVAL', 60)),
+                'timeout': int(os.getenv(f'{source.upper()}_TIMEOUT', cls.REQUEST_TIMEOUT)),
+            }
+            for source in cls.get_tor_sources()
         }
 
 
@@ -0,0 +1,45 @@
+"""
+Configuração do Gunicorn (lida automaticamente quando iniciado neste diretório)
+"""
+
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('GUNICORN_WORKERS', 3))
+
+# Threads por worker: um POST /api/check longo (~16µs por IP) ocupa só uma
+# delas, e o heartbeat do worker segue independente do streaming
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# Worker sem heartbeat por mais que isso é reiniciado pelo mestre
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+
+# O mestre carrega os snapshots de CACHE_DIR e pré-renderiza os feeds uma única
+# vez; os workers nascem por fork já aquecidos, compartilhando essas páginas
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def post_worker_init(worker):
+    """Inicia as threads de atualização e de métricas no worker, após o fork"""
+    import main
+    main.start_background_tasks(main.app)
+
+
+def on_starting(server):
+    """Descarta as métricas de execuções anteriores, antes de criar os workers"""
+    from config.settings import Config
+    from utils.metrics import REGISTRY
+    REGISTRY.configure(Config.get_cache_paths()['metrics'], Config.METRICS_FLUSH_SECONDS)
+    REGISTRY.clear()
+
+
+def worker_exit(server, worker):
+    """Grava os últimos valores do worker antes de ele sair"""
+    from utils.metrics import REGISTRY
+    REGISTRY.flush()
+
+
+def child_exit(server, worker):
+    """No mestre: soma as métricas do worker que terminou ao agregado"""
+    from utils.metrics import REGISTRY
+    REGISTRY.retire(worker.pid)
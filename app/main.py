@@ -3,7 +3,6 @@ CTI Protexion by Segark
 Serviço de monitoramento de nós Tor com API RESTful
 """
 
-import logging
 import mimetypes
 from datetime import datetime
 from flask import Flask
@@ -14,8 +13,12 @@ from config.settings import Config
 from services.tor_service import TorService
 from services.cache_service import CacheService
 from services.url_service import UrlService
+from services.feed_service import FeedService
+# Registra o esquema sqlite:// no flask-limiter
+import services.rate_limit_storage  # noqa: F401
 from api.routes import create_routes
 from utils.logger import setup_logger
+from utils.metrics import REGISTRY
 
 # Garante o mimetype correto ao servir fontes self-hosted (.woff2)
 mimetypes.add_type('font/woff2', '.woff2')
@@ -29,14 +32,21 @@ def create_app() -> Flask:
     # Setup logging
     setup_logger(app.config['LOG_LEVEL'])
     
+    # Métricas: cada worker publica seus valores num arquivo em CACHE_DIR
+    REGISTRY.configure(Config.get_cache_paths()['metrics'], Config.METRICS_FLUSH_SECONDS)
+    
     # Rate limiting
     limiter = Limiter(
         key_func=get_remote_address,
         app=app,
         default_limits=["200 per day", "50 per hour"],
-        storage_uri="memory://"
+        storage_uri=Config.get_rate_limit_storage(),
+        strategy=Config.RATE_LIMIT_STRATEGY
     )
-    
+    # Desligado (RATELIMIT_ENABLED=false), o limiter não se registra na app; os
+    # decoradores das rotas guardam só uma weakref, então a referência fica aqui
+    app.extensions.setdefault('limiter', set()).add(limiter)
+
     # Inicializar serviços
     cache_service = CacheService(
         cache_ttl_hours=app.config['CACHE_TTL_HOURS'],
@@ -50,34 +60,53 @@ def create_app() -> Flask:
 
     url_service = UrlService()
 
+    # Somente o que já está em CACHE_DIR: nenhuma busca upstream atrasa a subida
+    tor_service.load_snapshots()
+    feed_service = FeedService(tor_service)
+    feed_service.prerender()
+
     # Registrar rotas
-    create_routes(app, tor_service, url_service, limiter)
+    create_routes(app, tor_service, url_service, feed_service, limiter)
     
-    # Inicializar cache
-    try:
-        logging.info("Inicializando cache dos nós Tor...")
-        tor_service.initialize_cache()
-        logging.info("Cache inicializado com sucesso")
-    except Exception as e:
-        logging.error(f"Erro ao inicializar cache: {e}")
+    # As threads sobem por processo, após o fork (ver start_background_tasks);
+    # sem o hook do gunicorn.conf.py, na primeira requisição do processo
+    app.extensions['tor_service'] = tor_service
+    app.before_request(tor_service.start_background_updater)
     
     return app
 
+
+def start_background_tasks(flask_app: Flask) -> None:
+    """Inicia as threads de atualização e de métricas do processo atual.
+
+    Chamado pelo ``gunicorn.conf.py`` em cada worker, já após o fork.
+    """
+    flask_app.extensions['tor_service'].start_background_updater()
+    REGISTRY.start_flusher()
+
+
 app = create_app()
 
 if __name__ == '__main__':
 
+    # Processo único: as métricas gravadas por execuções anteriores não valem mais
+    REGISTRY.clear()
     print("Iniciando CTI Protexion by Segark...")
     print(f"Servidor iniciado em http://localhost:{Config.PORT}")
     print("Endpoints disponíveis:")
     print("   - GET / (página inicial)")
     print("   - GET /health (healthcheck)")
+    print("   - GET /metrics (métricas Prometheus)")
     print("   - GET /tornodes-ip.txt (lista de IPs)")
     print("   - GET /honeypot-urls.txt (lista de URLs)")
     print("   - GET /status (status do serviço)")
     print("   - GET /api/nodes (todos os nós detalhados)")
     print("   - GET /api/nodes/running (nós ativos)")
+    print("   - GET /api/nodes/query (filtros combinados)")
     print("   - GET /api/stats (estatísticas detalhadas)")
+    print("   - GET /api/exit-nodes/diff?since=<versão> (mudanças na lista de exits)")
+    print("   - GET /api/check/<ip> (verifica se o IP é exit)")
+    print("   - POST /api/check (enriquecimento de IPs em lote, NDJSON)")
     print("   - GET /api/feed/rss (feed RSS)")
     
     app.run(
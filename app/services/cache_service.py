@@ -3,13 +3,24 @@ Serviço de gerenciamento de cache
 """
 
 import os
+import json
 import time
 import logging
+import threading
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Tuple
 from dataclasses import dataclass
 
 from config.settings import Config
+from services.exit_lookup import ExitLookup
+from services.node_index import NodeIndex
+from services.node_statistics import NodeStatistics, compute_statistics
+from services.relay_store import RelayStore
+from services.snapshot_file import encode_snapshot, open_snapshot, read_snapshot_version
+from utils.files import atomic_write
+
+# Identificador do formato do arquivo único do cache de exit nodes
+EXIT_CACHE_FORMAT = 'tor-exit-cache/1'
 
 
 @dataclass
@@ -21,6 +32,41 @@ class CacheInfo:
     item_count: int
 
 
+@dataclass(frozen=True)
+class ExitDelta:
+    """IPs que entraram e saíram da lista de exits em uma versão"""
+    version: int
+    added: Tuple[str, ...]
+    removed: Tuple[str, ...]
+    timestamp: float
+
+
+@dataclass(frozen=True)
+class ExitCacheState:
+    """Snapshot do cache de exit nodes mantido em memória.
+    
+    ``stat`` identifica a versão do arquivo (inode, mtime, tamanho) que
+    originou o estado; enquanto não mudar, nenhuma leitura é necessária.
+    ``version`` cresce a cada mudança no conjunto de IPs e ``deltas`` guarda
+    as últimas mudanças (log limitado a ``EXIT_DIFF_LOG_SIZE`` versões).
+    """
+    stat: Optional[tuple]
+    entries: Tuple[Tuple[str, str], ...]
+    timestamp: Optional[float]
+    validators: Dict[str, str]
+    lookup: ExitLookup
+    version: int = 0
+    deltas: Tuple[ExitDelta, ...] = ()
+    
+    @property
+    def exists(self) -> bool:
+        return self.stat is not None
+    
+    @property
+    def ips(self) -> List[str]:
+        return [ip for ip, _ in self.entries]
+
+
 class CacheService:
     """Serviço responsável pelo gerenciamento de cache"""
     
@@ -29,11 +75,23 @@ class CacheService:
         self.detailed_cache_ttl_minutes = detailed_cache_ttl_minutes
         self.cache_paths = Config.get_cache_paths()
         self.detailed_cache: Dict[str, Any] = {
-            'data': [],
-            'last_updated': None
+            'store': RelayStore(),
+            'last_updated': None,
+            'version': None,
+            'validators': {}
         }
+        self.detailed_index = NodeIndex(self.detailed_cache['store'])
+        self.detailed_stats = NodeStatistics()
+        self._detailed_snapshot_stat: Optional[tuple] = None
+        self._sync_lock = threading.Lock()
+        self._listeners: List[Callable[[str], None]] = []
+        self._exit_state = ExitCacheState(
+            stat=None, entries=(), timestamp=None, validators={}, lookup=ExitLookup([])
+        )
         
         self._ensure_cache_directory()
+        # Worker novo já nasce com o último snapshot publicado, sem rede
+        self.sync_detailed_cache()
     
     def _ensure_cache_directory(self) -> None:
         """Garante que o diretório de cache existe"""
@@ -42,25 +100,120 @@ class CacheService:
             os.makedirs(cache_dir, exist_ok=True)
             logging.info(f"Diretório de cache criado: {cache_dir}")
     
+    def add_listener(self, callback: Callable[[str], None]) -> None:
+        """Registra um callback chamado com ``'exit'`` ou ``'detailed'`` quando um snapshot é
+        instalado ou, no caso do detalhado, revalidado (``last_updated`` novo).
+        
+        No worker que buscou a fonte, os callbacks do detalhado terminam antes
+        de o snapshot (ou o mtime da revalidação) ficar visível para os demais
+        workers: o que eles publicam a partir dele já está em disco quando os
+        outros o adotam.
+        """
+        self._listeners.append(callback)
+    
+    def _notify(self, kind: str) -> None:
+        for callback in self._listeners:
+            try:
+                callback(kind)
+            except Exception as e:
+                logging.error(f"Erro em listener do cache ({kind}): {e}")
+    
+    def _exit_cache_state(self) -> ExitCacheState:
+        """Estado do cache de exit nodes, relido apenas quando o arquivo muda.
+        
+        Custa um ``stat`` quando nada mudou; quando outro worker publica um
+        arquivo novo, basta uma abertura e uma leitura.
+        """
+        path = self.cache_paths['exit_cache']
+        stat_key = self._stat_key(path)
+        state = self._exit_state
+        if stat_key == state.stat:
+            return state
+        
+        if stat_key is None:
+            payload: Dict[str, Any] = {}
+        else:
+            try:
+                with open(path, 'rb') as f:
+                    payload = json.loads(f.read())
+                if payload.get('format') != EXIT_CACHE_FORMAT:
+                    raise ValueError(f"formato desconhecido: {payload.get('format')}")
+            except (OSError, ValueError) as e:
+                logging.error(f"Erro ao carregar cache de exit nodes: {e}")
+                return state
+        
+        state = self._build_exit_state(
+            stat_key,
+            payload.get('entries', []),
+            payload.get('fetched_at'),
+            payload.get('validators') or {},
+            version=payload.get('version', 0),
+            deltas=tuple(
+                ExitDelta(version, tuple(added), tuple(removed), timestamp)
+                for version, added, removed, timestamp in payload.get('deltas', [])
+            )
+        )
+        self._exit_state = state
+        return state
+    
+    @staticmethod
+    def _build_exit_state(
+        stat_key: Optional[tuple],
+        entries: List[Tuple[str, str]],
+        timestamp: Optional[float],
+        validators: Dict[str, str],
+        lookup: Optional[ExitLookup] = None,
+        version: int = 0,
+        deltas: Tuple[ExitDelta, ...] = ()
+    ) -> ExitCacheState:
+        entries = tuple((ip, last_seen) for ip, last_seen in entries)
+        return ExitCacheState(
+            stat=stat_key,
+            entries=entries,
+            timestamp=timestamp,
+            validators=validators,
+            lookup=lookup if lookup is not None else ExitLookup.from_entries(entries),
+            version=version,
+            deltas=deltas
+        )
+    
+    def _write_exit_cache(
+        self,
+        entries: Tuple[Tuple[str, str], ...],
+        validators: Dict[str, str],
+        lookup: Optional[ExitLookup] = None,
+        version: int = 0,
+        deltas: Tuple[ExitDelta, ...] = ()
+    ) -> None:
+        """Grava o arquivo único do cache de exit nodes e atualiza o estado local"""
+        fetched_at = time.time()
+        payload = {
+            'format': EXIT_CACHE_FORMAT,
+            'fetched_at': fetched_at,
+            'validators': validators,
+            'count': len(entries),
+            'entries': entries,
+            'version': version,
+            'deltas': [
+                [delta.version, delta.added, delta.removed, delta.timestamp] for delta in deltas
+            ]
+        }
+        path = self.cache_paths['exit_cache']
+        atomic_write(path, json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        self._exit_state = self._build_exit_state(
+            self._stat_key(path), entries, fetched_at, validators, lookup, version, deltas
+        )
+    
     def needs_exit_cache_update(self) -> bool:
         """Verifica se o cache de exit nodes precisa ser atualizado"""
-        cache_file = self.cache_paths['exit_cache']
-        timestamp_file = self.cache_paths['exit_timestamp']
-        
-        if not os.path.exists(cache_file) or not os.path.exists(timestamp_file):
+        state = self._exit_cache_state()
+        if not state.exists or state.timestamp is None:
             return True
         
-        try:
-            with open(timestamp_file, 'r', encoding='utf-8') as f:
-                timestamp = float(f.read().strip())
-            
-            last_update = datetime.utcfromtimestamp(timestamp)
-            time_diff = datetime.utcnow() - last_update
-            
-            return time_diff > timedelta(hours=self.cache_ttl_hours)
-        except (ValueError, IOError) as e:
-            logging.warning(f"Erro ao verificar timestamp do cache: {e}")
-            return True
+        last_update = datetime.utcfromtimestamp(state.timestamp)
+        time_diff = datetime.utcnow() - last_update
+        
+        return time_diff > timedelta(hours=self.cache_ttl_hours)
     
     def needs_detailed_cache_update(self) -> bool:
         """Verifica se o cache detalhado precisa ser atualizado"""
@@ -70,82 +223,268 @@ class CacheService:
         time_diff = datetime.utcnow() - self.detailed_cache['last_updated']
         return time_diff > timedelta(minutes=self.detailed_cache_ttl_minutes)
     
-    def save_exit_cache(self, ips: List[str], ips_with_timestamp: List[str]) -> None:
-        """Salva o cache de exit nodes"""
+    def save_exit_cache(
+        self,
+        entries: List[Tuple[str, str]],
+        validators: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Salva o cache de exit nodes: pares ``(ip, último_visto)``, horário da
+        busca e validadores HTTP da resposta de origem, num único arquivo.
+        
+        Se o conjunto de IPs mudou, incrementa a versão e registra o delta
+        (IPs adicionados e removidos) no log limitado do próprio arquivo.
+        """
+        previous = self._exit_cache_state()
+        old_ips = set(previous.ips)
+        new_ips = {ip for ip, _ in entries}
+        added = tuple(sorted(new_ips - old_ips))
+        removed = tuple(sorted(old_ips - new_ips))
+        
+        version, deltas = previous.version, previous.deltas
+        if added or removed:
+            version += 1
+            delta = ExitDelta(version, added, removed, time.time())
+            deltas = (deltas + (delta,))[-Config.EXIT_DIFF_LOG_SIZE:]
+        
         try:
-            # Cache simples com IPs
-            with open(self.cache_paths['exit_cache'], 'w', encoding='utf-8') as f:
-                f.write('\n'.join(ips))
-            
-            # Cache detalhado com timestamps
-            with open(self.cache_paths['detailed_cache'], 'w', encoding='utf-8') as f:
-                f.write('\n'.join(ips_with_timestamp))
-            
-            # Timestamp
-            with open(self.cache_paths['exit_timestamp'], 'w', encoding='utf-8') as f:
-                f.write(str(time.time()))
-            
-            logging.info(f"Cache de exit nodes salvo: {len(ips)} IPs")
+            self._write_exit_cache(tuple(entries), validators or {}, version=version, deltas=deltas)
+            logging.info(
+                f"Cache de exit nodes salvo: {len(entries)} IPs "
+                f"(versão {version}, +{len(added)}/-{len(removed)})"
+            )
             
         except IOError as e:
             logging.error(f"Erro ao salvar cache de exit nodes: {e}")
             raise
+        
+        self._notify('exit')
+    
+    def touch_exit_cache(self) -> None:
+        """Renova o TTL do cache de exit nodes quando a origem não mudou"""
+        state = self._exit_cache_state()
+        self._write_exit_cache(
+            state.entries, state.validators, state.lookup, state.version, state.deltas
+        )
+        logging.info("Cache de exit nodes revalidado sem alterações")
+    
+    def load_exit_validators(self) -> Dict[str, str]:
+        """Carrega os validadores HTTP associados ao cache de exit nodes"""
+        return dict(self._exit_cache_state().validators)
+    
+    def get_exit_diff(self, since: Optional[int]) -> Dict[str, Any]:
+        """Mudanças líquidas na lista de exits desde a versão ``since``.
+        
+        Quando ``since`` é ``None``, desconhecido ou anterior ao início do log,
+        retorna a lista completa (``full``). Versão e dados vêm do mesmo estado.
+        """
+        state = self._exit_cache_state()
+        changes = None if since is None else self._merge_exit_deltas(state, since)
+        
+        if changes is None:
+            return {'version': state.version, 'full': True, 'ips': state.ips}
+        
+        added, removed = changes
+        return {
+            'version': state.version,
+            'since': since,
+            'full': False,
+            'added': added,
+            'removed': removed
+        }
+    
+    @staticmethod
+    def _merge_exit_deltas(state: ExitCacheState, since: int) -> Optional[Tuple[List[str], List[str]]]:
+        if since == state.version:
+            return [], []
+        
+        pending = [delta for delta in state.deltas if delta.version > since]
+        if since > state.version or not pending or pending[0].version != since + 1:
+            return None
+        
+        added: set = set()
+        removed: set = set()
+        for delta in pending:
+            for ip in delta.added:
+                if ip in removed:
+                    removed.discard(ip)
+                else:
+                    added.add(ip)
+            for ip in delta.removed:
+                if ip in added:
+                    added.discard(ip)
+                else:
+                    removed.add(ip)
+        
+        return sorted(added), sorted(removed)
+    
+    def get_exit_cache_timestamp(self) -> Optional[float]:
+        """Retorna o timestamp (epoch) da última atualização do cache de exit nodes"""
+        return self._exit_cache_state().timestamp
     
     def load_exit_cache(self) -> List[str]:
         """Carrega o cache de exit nodes"""
+        return self._exit_cache_state().ips
+    
+    def get_exit_lookup(self) -> ExitLookup:
+        """Conjunto de IPs exit para consultas pontuais, do snapshot atual"""
+        return self._exit_cache_state().lookup
+    
+    def save_detailed_cache(
+        self,
+        store: RelayStore,
+        validators: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Salva o cache detalhado dos nós e o publica para os demais workers.
+        
+        O snapshot é instalado a partir do arquivo temporário já completo (o
+        mmap sobrevive ao rename) e só então publicado: os demais workers o
+        adotam com os listeners deste já concluídos.
+        """
+        version = time.time_ns()
+        validators = validators or {}
+        published_at = int(time.time())
+        last_updated = self._published_datetime(published_at)
+        
+        def install(tmp_path: str) -> None:
+            self._install_detailed_cache(open_snapshot(tmp_path).store, last_updated, version, validators)
+        
         try:
-            with open(self.cache_paths['exit_cache'], 'r', encoding='utf-8') as f:
-                return [line.strip() for line in f if line.strip()]
-        except IOError as e:
-            logging.error(f"Erro ao carregar cache de exit nodes: {e}")
-            return []
+            path = self.cache_paths['detailed_snapshot']
+            atomic_write(path, encode_snapshot(store, version, validators), published_at, install)
+            self._detailed_snapshot_stat = self._stat_key(path)
+        except (OSError, ValueError) as e:
+            logging.error(f"Erro ao persistir snapshot detalhado: {e}")
+            if self.detailed_cache['version'] != version:
+                self._install_detailed_cache(store, last_updated, version, validators)
+        
+        logging.info(f"Cache detalhado salvo: {len(store)} nós")
     
-    def save_detailed_cache(self, nodes: List[Dict[str, Any]]) -> None:
-        """Salva o cache detalhado dos nós"""
-        self.detailed_cache['data'] = nodes
-        self.detailed_cache['last_updated'] = datetime.utcnow()
-        logging.info(f"Cache detalhado salvo: {len(nodes)} nós")
+    def _install_detailed_cache(
+        self,
+        store: RelayStore,
+        last_updated: datetime,
+        version: Any,
+        validators: Dict[str, str]
+    ) -> None:
+        """Instala um snapshot detalhado e reconstrói seus índices e estatísticas"""
+        index = NodeIndex(store)
+        stats = compute_statistics(store)
+        self.detailed_cache['store'] = store
+        self.detailed_cache['last_updated'] = last_updated
+        self.detailed_cache['version'] = version
+        self.detailed_cache['validators'] = validators
+        self.detailed_index = index
+        self.detailed_stats = stats
+        self._notify('detailed')
     
-    def load_detailed_cache(self) -> List[Dict[str, Any]]:
-        """Carrega o cache detalhado dos nós"""
-        return self.detailed_cache['data']
+    def touch_detailed_cache(self) -> None:
+        """Renova o TTL do snapshot detalhado quando a origem não mudou.
+        
+        Atualiza também o mtime do arquivo publicado, para que os demais
+        workers vejam a revalidação sem recarregar os dados (os listeners
+        rodam antes, como em ``save_detailed_cache``).
+        """
+        published_at = int(time.time())
+        self.detailed_cache['last_updated'] = self._published_datetime(published_at)
+        self._notify('detailed')
+        
+        path = self.cache_paths['detailed_snapshot']
+        try:
+            os.utime(path, (published_at, published_at))
+            self._detailed_snapshot_stat = self._stat_key(path)
+        except OSError as e:
+            logging.warning(f"Erro ao revalidar snapshot detalhado: {e}")
+        logging.info("Cache detalhado revalidado sem alterações")
+    
+    @staticmethod
+    def _published_datetime(mtime: int) -> datetime:
+        """``last_updated`` de um snapshot a partir do mtime do arquivo publicado.
+        
+        Em segundos inteiros, para que o worker que publica e os que adotam
+        cheguem ao mesmo valor em qualquer sistema de arquivos.
+        """
+        return datetime.utcfromtimestamp(mtime)
+    
+    @staticmethod
+    def _stat_key(path: str) -> Optional[tuple]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    
+    def detailed_snapshot_changed(self) -> bool:
+        """Indica, com um ``stat``, se há snapshot publicado ainda não adotado aqui"""
+        stat_key = self._stat_key(self.cache_paths['detailed_snapshot'])
+        return stat_key is not None and stat_key != self._detailed_snapshot_stat
+    
+    def sync_detailed_cache(self) -> bool:
+        """Mapeia o snapshot detalhado publicado por outro worker, se mudou.
+        
+        Custa um ``stat`` quando nada mudou e a leitura do cabeçalho quando o
+        arquivo foi apenas revalidado. Retorna ``True`` se instalou dados novos.
+        Chamado na inicialização e pela thread de atualização; no caminho de
+        uma requisição, só enquanto o processo ainda não tem nenhum dado.
+        """
+        if not self.detailed_snapshot_changed():
+            return False
+        with self._sync_lock:
+            return self._adopt_detailed_snapshot()
+    
+    def _adopt_detailed_snapshot(self) -> bool:
+        path = self.cache_paths['detailed_snapshot']
+        stat_key = self._stat_key(path)
+        if stat_key is None or stat_key == self._detailed_snapshot_stat:
+            return False
+        
+        try:
+            version = read_snapshot_version(path)
+            if version is not None and version == self.detailed_cache['version']:
+                # Apenas revalidado por outro worker: mesmos dados, TTL renovado
+                self._detailed_snapshot_stat = stat_key
+                self.detailed_cache['last_updated'] = self._published_datetime(stat_key[1] // 10**9)
+                self._notify('detailed')
+                return False
+            snapshot = open_snapshot(path)
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Erro ao carregar snapshot detalhado: {e}")
+            return False
+        
+        self._detailed_snapshot_stat = stat_key
+        self._install_detailed_cache(
+            snapshot.store,
+            self._published_datetime(stat_key[1] // 10**9),
+            snapshot.version,
+            snapshot.validators
+        )
+        logging.info(f"Snapshot detalhado mapeado: {len(snapshot.store)} nós (versão {snapshot.version})")
+        return True
+    
+    def load_detailed_cache(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Carrega o cache detalhado dos nós como dicionários (opcionalmente só os ``limit`` primeiros)"""
+        store = self.detailed_cache['store']
+        rows = range(len(store) if limit is None else min(limit, len(store)))
+        return store.to_dicts(rows)
     
     def get_exit_cache_info(self) -> CacheInfo:
         """Retorna informações sobre o cache de exit nodes"""
-        cache_file = self.cache_paths['exit_cache']
-        timestamp_file = self.cache_paths['exit_timestamp']
-        
-        exists = os.path.exists(cache_file)
+        state = self._exit_cache_state()
         last_update = None
-        item_count = 0
-        
-        if exists:
-            try:
-                # Conta itens
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    item_count = len([line for line in f if line.strip()])
-                
-                # Pega timestamp
-                if os.path.exists(timestamp_file):
-                    with open(timestamp_file, 'r', encoding='utf-8') as f:
-                        timestamp = float(f.read().strip())
-                    last_update = datetime.utcfromtimestamp(timestamp)
-                    
-            except (ValueError, IOError) as e:
-                logging.warning(f"Erro ao obter informações do cache: {e}")
+        if state.exists and state.timestamp is not None:
+            last_update = datetime.utcfromtimestamp(state.timestamp)
         
         return CacheInfo(
-            exists=exists,
+            exists=state.exists,
             last_update=last_update,
             needs_update=self.needs_exit_cache_update(),
-            item_count=item_count
+            item_count=len(state.entries)
         )
     
     def get_detailed_cache_info(self) -> CacheInfo:
         """Retorna informações sobre o cache detalhado"""
         return CacheInfo(
-            exists=len(self.detailed_cache['data']) > 0,
+            exists=len(self.detailed_cache['store']) > 0,
             last_update=self.detailed_cache['last_updated'],
             needs_update=self.needs_detailed_cache_update(),
-            item_count=len(self.detailed_cache['data'])
+            item_count=len(self.detailed_cache['store'])
         )
@@ -0,0 +1,148 @@
+"""
+Circuit breaker por fonte upstream
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from utils.files import atomic_write
+
+
+class CircuitBreaker:
+    """Suspende as buscas a uma fonte após falhas consecutivas.
+
+    Fechado, toda busca é permitida. Após ``failure_threshold`` falhas
+    seguidas o circuito abre e nenhuma busca é feita por ``reset_timeout``
+    segundos; depois disso uma única tentativa é liberada (meio-aberto).
+    Se ela falhar, o circuito reabre com o dobro da espera, até
+    ``max_reset_timeout``; se der certo, volta a fechar.
+
+    Com ``state_path``, o estado (falhas, reabertura e espera atual) fica
+    num arquivo compartilhado por todos os workers: um único circuito por
+    fonte, em vez de um por processo. Leituras custam um ``stat``; as
+    transições são feitas por quem detém o lock de atualização da fonte.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 60.0,
+                 max_reset_timeout: float = 1800.0, state_path: Optional[str] = None):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max(reset_timeout, max_reset_timeout)
+        self.state_path = state_path
+        self.state = self.CLOSED
+        self.failures = 0
+        # Horário de parede: comparável entre processos e reinícios
+        self.retry_at = 0.0
+        self._timeout = reset_timeout
+        self._stat_key: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        """Adota o estado persistido por outro processo, se o arquivo mudou"""
+        if self.state_path is None:
+            return
+        try:
+            stat = os.stat(self.state_path)
+        except FileNotFoundError:
+            return
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._stat_key:
+            return
+        try:
+            with open(self.state_path, 'r') as f:
+                data = json.load(f)
+            self.state = data['state']
+            self.failures = data['failures']
+            self.retry_at = data['retry_at']
+            self._timeout = data['timeout']
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Estado do circuito da fonte '{self.name}' ilegível: {e}")
+        self._stat_key = stat_key
+
+    def _save(self) -> None:
+        if self.state_path is None:
+            return
+        data = {
+            'state': self.state,
+            'failures': self.failures,
+            'retry_at': self.retry_at,
+            'timeout': self._timeout
+        }
+        try:
+            atomic_write(self.state_path, json.dumps(data).encode('utf-8'))
+        except OSError as e:
+            logging.warning(f"Erro ao gravar o estado do circuito da fonte '{self.name}': {e}")
+            return
+        stat = os.stat(self.state_path)
+        self._stat_key = (stat.st_mtime_ns, stat.st_size)
+
+    def is_open(self) -> bool:
+        """Indica se as buscas estão suspensas agora (sem alterar o estado)"""
+        with self._lock:
+            self._load()
+            return self.state == self.OPEN and time.time() < self.retry_at
+
+    def retry_in(self) -> float:
+        """Segundos até a próxima tentativa liberada (0 se o circuito não está aberto)"""
+        with self._lock:
+            self._load()
+            return max(0.0, self.retry_at - time.time()) if self.state == self.OPEN else 0.0
+
+    def allow(self) -> bool:
+        """Libera uma busca; no fim da espera, passa a meio-aberto e libera a tentativa"""
+        with self._lock:
+            self._load()
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() >= self.retry_at:
+                self.state = self.HALF_OPEN
+                self._save()
+                logging.info(f"Circuito da fonte '{self.name}' meio-aberto: nova tentativa")
+                return True
+            return self.state == self.HALF_OPEN
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._load()
+            if self.state == self.CLOSED and self.failures == 0:
+                return
+            if self.state != self.CLOSED:
+                logging.info(f"Circuito da fonte '{self.name}' fechado")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._timeout = self.reset_timeout
+            self._save()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._load()
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+            elif self.failures < self.failure_threshold:
+                self._save()
+                return
+            self.state = self.OPEN
+            self.retry_at = time.time() + self._timeout
+            self._save()
+            logging.warning(
+                f"Circuito da fonte '{self.name}' aberto após {self.failures} falhas; "
+                f"nova tentativa em {self._timeout:.0f}s"
+            )
+
+    def to_dict(self) -> Dict[str, Any]:
+        retry_in = self.retry_in()
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'retry_in_seconds': round(retry_in, 1)
+        }
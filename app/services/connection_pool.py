@@ -0,0 +1,91 @@
+"""Pool limitado de conexões MySQL, compartilhado pelas requisições de um worker."""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+import pymysql
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhaustedError(pymysql.MySQLError):
+    """Nenhuma conexão ficou livre dentro do tempo de espera."""
+
+
+class ConnectionPool:
+    """Mantém até ``max_size`` conexões abertas e reaproveita as ociosas.
+
+    Conexões paradas há mais de ``ping_after`` segundos são validadas com
+    ``ping`` antes do uso; uma conexão que falha durante o uso é descartada
+    em vez de voltar ao pool.
+    """
+
+    def __init__(
+        self,
+        db_config: Dict[str, Any],
+        max_size: int = 4,
+        acquire_timeout: float = 5.0,
+        ping_after: float = 30.0,
+    ) -> None:
+        self.db_config = db_config
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.ping_after = ping_after
+        self._idle: List[Any] = []
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> Any:
+        with self._lock:
+            entry = self._idle.pop() if self._idle else None
+
+        if entry is None:
+            return pymysql.connect(**self.db_config)
+
+        connection, released_at = entry
+        if time.monotonic() - released_at > self.ping_after:
+            try:
+                connection.ping(reconnect=True)
+            except BaseException:
+                # Ainda não foi entregue a ``connection()``: fecha aqui para não vazar o socket
+                self._discard(connection)
+                raise
+        return connection
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Empresta uma conexão; levanta ``pymysql.MySQLError`` se indisponível."""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise PoolExhaustedError("Pool de conexões esgotado")
+
+        connection = None
+        try:
+            connection = self._checkout()
+            yield connection
+        except BaseException:
+            if connection is not None:
+                self._discard(connection)
+                connection = None
+            raise
+        finally:
+            if connection is not None:
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+            self._slots.release()
+
+    @staticmethod
+    def _discard(connection: Any) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """Fecha todas as conexões ociosas."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._discard(connection)
@@ -0,0 +1,80 @@
+"""
+Consulta rápida de pertinência de IPs na lista de nós exit
+"""
+
+import bisect
+import calendar
+import ipaddress
+import logging
+import socket
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+LAST_SEEN_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _parse_last_seen(value: str) -> int:
+    try:
+        return calendar.timegm(time.strptime(value.strip(), LAST_SEEN_FORMAT))
+    except ValueError:
+        return 0
+
+
+def _ip_key(ip: str) -> Tuple[int, int]:
+    """Converte o IP em ``(versão, inteiro)``, com caminho rápido para IPv4"""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except OSError:
+        address = ipaddress.ip_address(ip)
+        return address.version, int(address)
+
+
+class ExitLookup:
+    """Conjunto empacotado dos IPs exit com o último timestamp de cada um.
+
+    IPv4 vira um ``array`` ordenado de inteiros (busca binária, 4 bytes por
+    IP) com uma coluna paralela de epochs; IPv6, raro na lista, fica num dict.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, int]]):
+        ipv4: Dict[int, int] = {}
+        self.ipv6: Dict[int, int] = {}
+
+        for ip, last_seen in entries:
+            try:
+                version, key = _ip_key(ip)
+            except ValueError:
+                logging.debug(f"IP exit inválido ignorado: {ip}")
+                continue
+            target = ipv4 if version == 4 else self.ipv6
+            target[key] = max(last_seen, target.get(key, 0))
+
+        keys = sorted(ipv4)
+        self.ipv4 = array('I', keys)
+        self.ipv4_last_seen = array('Q', (ipv4[key] for key in keys))
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Tuple[str, str]]) -> 'ExitLookup':
+        """Constrói a partir de pares ``(ip, "AAAA-MM-DD HH:MM:SS")`` do cache"""
+        return cls((ip, _parse_last_seen(last_seen) if last_seen else 0) for ip, last_seen in entries)
+
+    def __len__(self) -> int:
+        return len(self.ipv4) + len(self.ipv6)
+
+    def get(self, ip: str) -> Tuple[bool, Optional[datetime]]:
+        """Retorna ``(é_exit, último_visto)`` para o IP informado"""
+        version, key = _ip_key(ip)
+
+        if version == 4:
+            pos = bisect.bisect_left(self.ipv4, key)
+            if pos == len(self.ipv4) or self.ipv4[pos] != key:
+                return False, None
+            last_seen = self.ipv4_last_seen[pos]
+        else:
+            if key not in self.ipv6:
+                return False, None
+            last_seen = self.ipv6[key]
+
+        return True, datetime.utcfromtimestamp(last_seen) if last_seen else None
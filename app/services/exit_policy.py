@@ -0,0 +1,102 @@
+"""
+Resumos de política de saída (``exit_policy_summary`` do Onionoo) compilados para consulta por porta
+"""
+
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+MAX_PORT = 65535
+
+
+def canonical_policy(summary: Optional[Dict[str, Any]]) -> str:
+    """Converte ``{"accept": ["80", "443"]}`` em ``"accept 80,443"`` (``''`` se ausente).
+
+    O texto canônico é internado no store: relays com a mesma política
+    compartilham uma única entrada.
+    """
+    if not summary:
+        return ''
+    for action in ('accept', 'reject'):
+        ports = summary.get(action)
+        if ports is not None:
+            return f"{action} {','.join(str(p) for p in ports)}"
+    return ''
+
+
+def policy_summary(policy: str) -> Optional[Dict[str, List[str]]]:
+    """Inverso de ``canonical_policy``, no formato do Onionoo"""
+    if not policy:
+        return None
+    action, _, ports = policy.partition(' ')
+    return {action: ports.split(',') if ports else []}
+
+
+class CompiledPolicy:
+    """Política como intervalos de portas ordenados; ``allows`` custa O(log intervalos)"""
+
+    __slots__ = ('accept', 'starts', 'ends')
+
+    def __init__(self, policy: str):
+        action, _, ports = policy.partition(' ')
+        self.accept = action == 'accept'
+
+        ranges: List[Tuple[int, int]] = []
+        for item in filter(None, ports.split(',')):
+            low, _, high = item.partition('-')
+            try:
+                ranges.append((int(low), int(high or low)))
+            except ValueError:
+                continue
+        ranges.sort()
+
+        self.starts = array('I')
+        self.ends = array('I')
+        for low, high in ranges:
+            if self.ends and low <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], high)
+            else:
+                self.starts.append(low)
+                self.ends.append(high)
+
+    def allows(self, port: int) -> bool:
+        pos = bisect.bisect_right(self.starts, port) - 1
+        listed = pos >= 0 and port <= self.ends[pos]
+        return listed if self.accept else not listed
+
+
+class PortPolicyIndex:
+    """Relays agrupados por política distinta, com resultado por porta memoizado.
+
+    Consultar uma porta avalia cada política distinta uma única vez (são
+    poucas frente ao número de relays) e concatena os grupos que a aceitam.
+    """
+
+    CACHE_SIZE = 256
+
+    def __init__(self, policies: Dict[str, array]):
+        self._groups = [(CompiledPolicy(policy), rows) for policy, rows in policies.items() if policy]
+        self._cache: 'OrderedDict[int, array]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rows_for_port(self, port: int) -> array:
+        """Linhas (ordenadas) dos relays cuja política aceita a porta"""
+        with self._lock:
+            rows = self._cache.get(port)
+            if rows is not None:
+                self._cache.move_to_end(port)
+                return rows
+
+        matched = array('I')
+        for compiled, group in self._groups:
+            if compiled.allows(port):
+                matched.extend(group)
+        rows = array('I', sorted(matched))
+
+        with self._lock:
+            self._cache[port] = rows
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return rows
@@ -0,0 +1,55 @@
+"""
+Corpos pré-renderizados dos feeds detalhados, publicados ao lado do snapshot
+"""
+
+import json
+import struct
+from typing import Any, Dict, Tuple
+
+from utils.compression import EncodedPrefix
+
+# magic, tamanho do bloco de metadados
+MAGIC = b'TORFEED2'
+HEADER = struct.Struct('<8sI')
+
+
+def encode_bundle(meta: Dict[str, Any], bodies: Dict[str, EncodedPrefix]) -> bytes:
+    """Serializa os prefixos dos corpos com todas as variantes já comprimidas.
+
+    ``meta`` identifica o snapshot que os originou e vai no cabeçalho.
+    """
+    blobs = []
+    offset = 0
+    feeds: Dict[str, Any] = {}
+    for name, encoded in bodies.items():
+        variants = {}
+        for encoding, data in encoded.variants.items():
+            variants[encoding] = [offset, len(data)]
+            blobs.append(data)
+            offset += len(data)
+        feeds[name] = {'mimetype': encoded.mimetype, 'variants': variants}
+
+    head = json.dumps({'meta': meta, 'feeds': feeds}, separators=(',', ':')).encode('utf-8')
+    return HEADER.pack(MAGIC, len(head)) + head + b''.join(blobs)
+
+
+def read_bundle(path: str) -> Tuple[Dict[str, Any], Dict[str, EncodedPrefix]]:
+    """Lê um pacote gravado por ``encode_bundle``; levanta ``ValueError`` se inválido"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"Pacote de feeds truncado: {path}")
+    magic, head_len = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"Pacote de feeds inválido: {path}")
+
+    head = json.loads(data[HEADER.size:HEADER.size + head_len])
+    base = HEADER.size + head_len
+    bodies = {}
+    for name, feed in head['feeds'].items():
+        variants = {
+            encoding: data[base + start:base + start + length]
+            for encoding, (start, length) in feed['variants'].items()
+        }
+        bodies[name] = EncodedPrefix(variants['identity'], feed['mimetype'], variants)
+    return head['meta'], bodies
@@ -0,0 +1,366 @@
+"""
+Serviço de feeds pré-renderizados por snapshot
+"""
+
+import base64
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+from config.settings import Config
+from services.feed_bundle import encode_bundle, read_bundle
+from services.node_query import NodeQuery, execute_query
+from services.tor_service import TorService
+from utils.compression import EncodedBody, EncodedPrefix, SplicedBody
+from utils.files import atomic_write
+from utils.formatters import format_exit_nodes_text
+from utils.metrics import CACHE_REQUESTS
+
+# Relays serializados por bloco nas respostas em streaming
+STREAM_BATCH_SIZE = 500
+
+
+class CursorExpiredError(ValueError):
+    """Cursor emitido para um snapshot que já foi substituído"""
+
+
+def encode_cursor(version: int, offset: int) -> str:
+    """Cursor opaco: versão do snapshot + posição da próxima linha"""
+    raw = f"{version}:{offset}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Inverso de ``encode_cursor``; levanta ``ValueError`` se malformado"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        version, offset = (int(part) for part in raw.split(':'))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Cursor inválido") from e
+    if offset < 0:
+        raise ValueError("Cursor inválido")
+    return version, offset
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _dump_json(payload: Dict[str, Any]) -> bytes:
+    """Serializa no mesmo formato compacto do ``jsonify`` em produção"""
+    return (json.dumps(payload, separators=(',', ':'), sort_keys=True) + '\n').encode('utf-8')
+
+
+def _open_for_last_updated(body: bytes) -> bytes:
+    """Reabre o objeto JSON serializado para receber ``last_updated`` como último campo"""
+    return body[:-2] + b',"last_updated":'
+
+
+class FeedService:
+    """Renderiza cada feed uma única vez por snapshot.
+
+    Quando o cache instala um snapshot novo, os feeds correspondentes são
+    serializados e comprimidos (gzip/brotli) imediatamente; cada requisição
+    passa a custar apenas a busca da variante já pronta.
+
+    Os feeds detalhados são renderizados uma vez por versão de snapshot em
+    todo o conjunto de workers: quem renderiza publica os corpos (com todas
+    as variantes) ao lado do snapshot, e os demais apenas os leem ao adotá-lo.
+    Esses corpos param antes do ``last_updated``, que muda a cada
+    revalidação (304) sem que os dados mudem: ele é anexado na resposta
+    (``EncodedPrefix.complete``), sem recomprimir o corpo.
+    """
+
+    DETAILED_FEEDS = ('nodes', 'running', 'stats')
+    EXIT_FEEDS = ('exit_ips',)
+
+    # O que fecha cada corpo detalhado depois do valor de ``last_updated``
+    LAST_UPDATED_CLOSING = {'nodes': b'}\n', 'running': b'}\n', 'stats': b'}}\n'}
+
+    def __init__(self, tor_service: TorService):
+        self.tor_service = tor_service
+        self.cache_service = tor_service.cache_service
+        self.bundle_path = Config.get_cache_paths()['detailed_feeds']
+        self._prepare_lock = threading.Lock()
+        self._bodies: Dict[str, Tuple[Any, Any]] = {}
+        # Corpo completo servido por feed detalhado: (prefixo, last_updated, corpo)
+        self._completed: Dict[str, Tuple[EncodedPrefix, Optional[datetime], SplicedBody]] = {}
+        self._renderers: Dict[str, Callable[[], Tuple[Any, Any]]] = {
+            'nodes': self._render_nodes,
+            'running': self._render_running,
+            'stats': self._render_stats,
+            'exit_ips': self._render_exit_ips,
+        }
+
+        self._query_cache: 'OrderedDict[Tuple[NodeQuery, Any], EncodedBody]' = OrderedDict()
+        # Workers gthread: o LRU é reordenado por várias threads ao mesmo tempo
+        self._query_lock = threading.Lock()
+        self.query_cache_size = Config.NODE_QUERY_CACHE_SIZE
+
+        self.cache_service.add_listener(self._on_snapshot)
+
+    def _on_snapshot(self, kind: str) -> None:
+        """Prepara os feeds afetados assim que um snapshot é instalado ou revalidado.
+
+        Roda na thread que instalou o snapshot (atualização em background ou
+        inicialização), nunca na de uma requisição.
+        """
+        if kind == 'detailed':
+            # Resultados de consultas anteriores nunca mais casam (trazem o last_updated)
+            self._query_cache = OrderedDict()
+            with self._prepare_lock:
+                # Numa revalidação a versão não muda: os corpos já prontos continuam valendo
+                version = self._detailed_key()
+                if any(self._bodies.get(feed, (None,))[0] != version for feed in self.DETAILED_FEEDS):
+                    self._prepare_detailed()
+                for feed in self.DETAILED_FEEDS:
+                    self._complete(feed, self._bodies[feed][1], True)
+            return
+        for feed in self.EXIT_FEEDS:
+            self._bodies[feed] = self._renderers[feed]()
+        logging.debug(f"Feeds pré-renderizados: {', '.join(self.EXIT_FEEDS)}")
+
+    def _prepare_detailed(self) -> None:
+        """Adota os corpos detalhados publicados para o snapshot atual; se ainda
+        não existirem, renderiza e os publica para os demais workers.
+
+        Chamado com ``_prepare_lock``.
+        """
+        version = self._detailed_key()
+        meta = {'version': version}
+
+        try:
+            published, bodies = read_bundle(self.bundle_path)
+            if published == meta and set(self.DETAILED_FEEDS) <= set(bodies):
+                for feed in self.DETAILED_FEEDS:
+                    self._bodies[feed] = (version, bodies[feed])
+                logging.debug(f"Feeds detalhados carregados do pacote publicado (versão {version})")
+                return
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Erro ao ler feeds publicados: {e}")
+
+        rendered = {feed: self._renderers[feed]() for feed in self.DETAILED_FEEDS}
+        self._bodies.update(rendered)
+        try:
+            bundle = encode_bundle(meta, {feed: body for feed, (_, body) in rendered.items()})
+            atomic_write(self.bundle_path, bundle)
+        except OSError as e:
+            logging.warning(f"Erro ao publicar feeds detalhados: {e}")
+        logging.debug(f"Feeds pré-renderizados: {', '.join(self.DETAILED_FEEDS)}")
+
+    def prerender(self) -> None:
+        """Prepara os feeds das fontes que já têm snapshot carregado.
+
+        Feito na inicialização: com ``--preload`` os corpos prontos são
+        herdados pelos workers no fork.
+        """
+        feeds = []
+        if self.tor_service.has_snapshot('onionoo'):
+            with self._prepare_lock:
+                self._prepare_detailed()
+            feeds.extend(self.DETAILED_FEEDS)
+        if self.tor_service.has_snapshot('exit_addresses'):
+            for feed in self.EXIT_FEEDS:
+                self._bodies[feed] = self._renderers[feed]()
+            feeds.extend(self.EXIT_FEEDS)
+        if feeds:
+            logging.info(f"Feeds pré-renderizados na inicialização: {', '.join(feeds)}")
+
+    def _source(self, feed: str) -> str:
+        return 'onionoo' if feed in self.DETAILED_FEEDS else 'exit_addresses'
+
+    def _current_version(self, feed: str) -> Any:
+        """Versão do snapshot que o feed deve refletir.
+
+        Levanta ``SnapshotUnavailableError`` se a fonte ainda não tem
+        nenhum snapshot: um feed vazio não é servido como se fosse atual.
+        """
+        source = self._source(feed)
+        self.tor_service.revalidate(source)
+        self.tor_service.require_snapshot(source)
+        if source == 'onionoo':
+            return self._detailed_key()
+        return self.cache_service.get_exit_cache_timestamp()
+
+    def _detailed_key(self) -> Any:
+        """Chave dos feeds detalhados: só a versão dos dados (``last_updated``
+        é anexado na resposta)"""
+        return self.cache_service.detailed_cache['version']
+
+    def _complete(self, feed: str, prefix: EncodedPrefix, current: bool) -> SplicedBody:
+        """Anexa o ``last_updated`` vigente ao corpo pré-renderizado (memoizado).
+
+        Um corpo de versão anterior (``current=False``) é servido como já
+        estava, com o ``last_updated`` da sua própria versão.
+        """
+        completed = self._completed.get(feed)
+        last_updated = self.cache_service.detailed_cache['last_updated']
+        if completed is not None and completed[0] is prefix and (not current or completed[1] == last_updated):
+            return completed[2]
+        suffix = json.dumps(_isoformat(last_updated)).encode('utf-8') + self.LAST_UPDATED_CLOSING[feed]
+        body = prefix.complete(suffix)
+        self._completed[feed] = (prefix, last_updated, body)
+        return body
+
+    def get(self, feed: str) -> Any:
+        """Retorna o corpo do feed para o snapshot atual (com ``to_response``).
+
+        Os corpos detalhados são mantidos pelo listener: enquanto o de um
+        snapshot recém-instalado é preparado, o anterior continua sendo
+        servido. O feed de exits, pequeno, é re-renderizado sob demanda.
+        """
+        version = self._current_version(feed)
+        cached = self._bodies.get(feed)
+        if feed in self.DETAILED_FEEDS:
+            if cached is None:
+                # Snapshot adotado agora mesmo: espera o listener terminar de prepará-lo
+                CACHE_REQUESTS.inc('feed', 'miss')
+                with self._prepare_lock:
+                    if feed not in self._bodies:
+                        self._prepare_detailed()
+                cached = self._bodies[feed]
+            else:
+                CACHE_REQUESTS.inc('feed', 'hit' if cached[0] == version else 'stale')
+            return self._complete(feed, cached[1], cached[0] == version)
+
+        if cached is not None and cached[0] == version:
+            CACHE_REQUESTS.inc('feed', 'hit')
+            return cached[1]
+
+        CACHE_REQUESTS.inc('feed', 'miss')
+        cached = self._renderers[feed]()
+        self._bodies[feed] = cached
+        return cached[1]
+
+    def query(self, query: NodeQuery) -> EncodedBody:
+        """Resultado de uma consulta combinada, memoizado por (consulta, snapshot).
+
+        Mantém um LRU de ``NODE_QUERY_CACHE_SIZE`` corpos serializados; a
+        compressão de cada um é feita sob demanda. Levanta ``ValueError`` para
+        filtros que o snapshot não suporta.
+        """
+        version = self._current_version('nodes')
+        if query.port is not None and not self.cache_service.detailed_index.store.details:
+            raise ValueError("port requer o documento /details do Onionoo (ONIONOO_DETAILS=true)")
+        key = (query, version, self.cache_service.detailed_cache['last_updated'])
+        # O listener substitui o dicionário a cada snapshot; usa-se sempre o mesmo aqui
+        query_cache = self._query_cache
+        with self._query_lock:
+            cached = query_cache.get(key)
+            if cached is not None:
+                query_cache.move_to_end(key)
+        if cached is not None:
+            CACHE_REQUESTS.inc('node_query', 'hit')
+            return cached
+        CACHE_REQUESTS.inc('node_query', 'miss')
+
+        index = self.cache_service.detailed_index
+        rows = execute_query(index, query)
+        body = _dump_json({
+            'status': 'success',
+            'query': query.to_dict(),
+            'total_nodes': len(rows),
+            'last_updated': _isoformat(self.cache_service.detailed_cache['last_updated']),
+            'nodes': index.store.to_dicts(rows)
+        })
+        encoded = EncodedBody(body, 'application/json', precompress=False)
+
+        with self._query_lock:
+            query_cache[key] = encoded
+            while len(query_cache) > self.query_cache_size:
+                query_cache.popitem(last=False)
+        return encoded
+
+    def stream_nodes(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> Iterator[str]:
+        """Página de ``/api/nodes`` serializada em blocos.
+
+        O snapshot é fixado antes da primeira linha; o cursor só é aceito
+        para a mesma versão de snapshot que o emitiu. Erros de parâmetro são
+        levantados aqui (antes do streaming começar).
+        """
+        self._current_version('nodes')
+        cache = self.cache_service.detailed_cache
+        version, store, last_updated = cache['version'], cache['store'], cache['last_updated']
+
+        offset = 0
+        if cursor:
+            cursor_version, offset = decode_cursor(cursor)
+            if cursor_version != version:
+                raise CursorExpiredError("Cursor expirado: o snapshot foi atualizado")
+        if limit is not None and limit < 1:
+            raise ValueError("limit deve ser maior que zero")
+
+        total = len(store)
+        end = total if limit is None else min(total, offset + limit)
+        build = store.to_dict if fields is None else store.projector(fields)
+        rows = range(offset, max(offset, end))
+
+        head = {
+            'status': 'success',
+            'total_nodes': total,
+            'count': len(rows),
+            'last_updated': _isoformat(last_updated),
+            'next_cursor': encode_cursor(version, end) if end < total else None
+        }
+        return self._iter_nodes_body(head, rows, build)
+
+    @staticmethod
+    def _iter_nodes_body(
+        head: Dict[str, Any],
+        rows: range,
+        build: Callable[[int], Dict[str, Any]]
+    ) -> Iterator[str]:
+        dumps = json.JSONEncoder(separators=(',', ':'), sort_keys=True).encode
+        yield dumps(head)[:-1] + ',"nodes":['
+
+        for start in range(rows.start, rows.stop, STREAM_BATCH_SIZE):
+            batch = range(start, min(start + STREAM_BATCH_SIZE, rows.stop))
+            prefix = ',' if start != rows.start else ''
+            yield prefix + ','.join(dumps(build(row)) for row in batch)
+
+        yield ']}\n'
+
+    def _render_nodes(self) -> Tuple[Any, EncodedPrefix]:
+        key, store = self._detailed_key(), self.cache_service.detailed_cache['store']
+        nodes = store.to_dicts()
+        body = _dump_json({
+            'status': 'success',
+            'total_nodes': len(nodes),
+            'nodes': nodes
+        })
+        return key, EncodedPrefix(_open_for_last_updated(body), 'application/json')
+
+    def _render_running(self) -> Tuple[Any, EncodedPrefix]:
+        key = self._detailed_key()
+        index = self.cache_service.detailed_index
+        running_nodes = index.store.to_dicts(index.running)
+        body = _dump_json({
+            'status': 'success',
+            'total_running_nodes': len(running_nodes),
+            'nodes': running_nodes
+        })
+        return key, EncodedPrefix(_open_for_last_updated(body), 'application/json')
+
+    def _render_stats(self) -> Tuple[Any, EncodedPrefix]:
+        key = self._detailed_key()
+        statistics = _dump_json(self.cache_service.detailed_stats.to_dict())
+        # ``last_updated`` fica dentro de ``statistics``, o último objeto do corpo
+        body = b'{"status":"success","statistics":' + _open_for_last_updated(statistics)
+        return key, EncodedPrefix(body, 'application/json')
+
+    def _render_exit_ips(self) -> Tuple[Any, EncodedBody]:
+        version = self.cache_service.get_exit_cache_timestamp()
+        ips = self.cache_service.load_exit_cache()
+        last_update = datetime.utcfromtimestamp(version) if version is not None else None
+        body = format_exit_nodes_text(ips, last_update).encode('utf-8')
+        return version, EncodedBody(body, 'text/plain')
@@ -0,0 +1,96 @@
+"""
+Índices secundários sobre o snapshot detalhado dos nós Tor
+"""
+
+import ipaddress
+from array import array
+from typing import Dict, Optional
+
+from services.exit_policy import PortPolicyIndex
+from services.relay_store import RelayStore
+
+
+class NodeIndex:
+    """Índices construídos uma vez por snapshot para leituras filtradas em O(resultado).
+
+    Cada índice é um ``array`` de linhas do ``RelayStore``; os dicionários só
+    são montados quando o resultado é serializado. As chaves de país são
+    normalizadas em maiúsculas na construção.
+    """
+
+    def __init__(self, store: RelayStore):
+        self.store = store
+        self.by_country: Dict[str, array] = {}
+        self.by_flag: Dict[str, array] = {}
+        self.by_as_name: Dict[str, array] = {}
+        self.by_address: Dict[str, int] = {}
+        self.running = array('I')
+
+        country_rows: Dict[int, array] = {}
+        policy_rows: Dict[int, array] = {}
+        as_rows: Dict[int, array] = {}
+        mask_rows: Dict[int, array] = {}
+
+        for row in range(len(store)):
+            for address in store.strings[store.addresses[row]].split(' '):
+                key = self._normalize_address(address)
+                if key is not None:
+                    self.by_address.setdefault(key, row)
+
+            country_rows.setdefault(store.country[row], array('I')).append(row)
+            as_rows.setdefault(store.as_name[row], array('I')).append(row)
+            policy_rows.setdefault(store.exit_policy[row], array('I')).append(row)
+
+            mask = store.flag_mask[row]
+            mask_rows.setdefault(mask, array('I')).append(row)
+
+            if store.running[row]:
+                self.running.append(row)
+
+        for country_id, rows in country_rows.items():
+            key = (store.countries[country_id] or 'Unknown').upper()
+            self.by_country.setdefault(key, array('I')).extend(rows)
+
+        for as_id, rows in as_rows.items():
+            self.by_as_name[store.as_names[as_id] or 'Unknown'] = rows
+
+        # Poucas máscaras distintas: expande os bits uma vez por máscara
+        for flag_id, flag in enumerate(store.flags.values):
+            bit = 1 << flag_id
+            rows = array('I')
+            for mask, mask_row_ids in mask_rows.items():
+                if mask & bit:
+                    rows.extend(mask_row_ids)
+            self.by_flag[flag] = array('I', sorted(rows))
+
+        self.port_policy = PortPolicyIndex(
+            {store.policies[policy_id]: rows for policy_id, rows in policy_rows.items()}
+        )
+
+    @staticmethod
+    def _normalize_address(address: str) -> Optional[str]:
+        """Converte ``1.2.3.4`` / ``[2001:db8::1]`` na forma canônica do IP"""
+        try:
+            return str(ipaddress.ip_address(address.strip('[]')))
+        except ValueError:
+            return None
+
+    def address(self, ip: str) -> Optional[int]:
+        """Linha do relay que anuncia o IP (já normalizado), se houver"""
+        return self.by_address.get(ip)
+
+    def country(self, country_code: str) -> array:
+        """Linhas dos nós de um país (código case-insensitive)"""
+        return self.by_country.get(country_code.upper(), array('I'))
+
+    def flag(self, flag: str) -> array:
+        """Linhas dos nós que possuem a flag informada"""
+        return self.by_flag.get(flag, array('I'))
+
+    def port(self, port: int) -> array:
+        """Linhas dos relays cuja política de saída aceita a porta (requer /details)"""
+        return self.port_policy.rows_for_port(port)
+
+    def as_name(self, as_name: str) -> array:
+        """Linhas dos nós pertencentes ao AS informado"""
+        return self.by_as_name.get(as_name, array('I'))
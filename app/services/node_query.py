@@ -0,0 +1,185 @@
+"""
+Consultas combinadas sobre o snapshot detalhado dos nós Tor
+"""
+
+from array import array
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional
+
+from services.exit_policy import MAX_PORT
+from services.node_index import NodeIndex
+
+FIRST_SEEN_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in (value or '').split(',') if part.strip()]
+
+
+def _parse_int(args: Mapping[str, str], name: str) -> Optional[int]:
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} deve ser um número inteiro")
+    if number < 0:
+        raise ValueError(f"{name} não pode ser negativo")
+    return number
+
+
+def _parse_timestamp(args: Mapping[str, str], name: str) -> Optional[str]:
+    """Normaliza datas ISO (``AAAA-MM-DD`` ou com horário) para o formato do Onionoo"""
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.fromisoformat(value.strip()).strftime(FIRST_SEEN_FORMAT)
+    except ValueError:
+        raise ValueError(f"{name} deve ser uma data ISO (AAAA-MM-DD[THH:MM:SS])")
+
+
+@dataclass(frozen=True)
+class NodeQuery:
+    """Filtro normalizado: duas consultas equivalentes geram o mesmo objeto (e hash).
+
+    Os campos de conjunto são combinados assim: qualquer um dos ``countries``,
+    todas as ``flags``.
+    """
+    countries: FrozenSet[str] = frozenset()
+    flags: FrozenSet[str] = frozenset()
+    as_name: Optional[str] = None
+    min_bandwidth: Optional[int] = None
+    max_bandwidth: Optional[int] = None
+    first_seen_after: Optional[str] = None
+    first_seen_before: Optional[str] = None
+    port: Optional[int] = None
+
+    PARAMETERS = (
+        'country', 'flag', 'as_name', 'min_bandwidth', 'max_bandwidth',
+        'first_seen_after', 'first_seen_before', 'port'
+    )
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str]) -> 'NodeQuery':
+        """Monta a consulta a partir da query string; levanta ``ValueError`` se inválida"""
+        unknown = sorted(set(args) - set(cls.PARAMETERS))
+        if unknown:
+            raise ValueError(f"Parâmetros desconhecidos: {', '.join(unknown)}")
+
+        query = cls(
+            countries=frozenset(c.upper() for c in _split(args.get('country'))),
+            flags=frozenset(_split(args.get('flag'))),
+            as_name=(args.get('as_name') or '').strip() or None,
+            min_bandwidth=_parse_int(args, 'min_bandwidth'),
+            max_bandwidth=_parse_int(args, 'max_bandwidth'),
+            first_seen_after=_parse_timestamp(args, 'first_seen_after'),
+            first_seen_before=_parse_timestamp(args, 'first_seen_before'),
+            port=_parse_int(args, 'port'),
+        )
+        if query.port is not None and not 1 <= query.port <= MAX_PORT:
+            raise ValueError(f"port deve estar entre 1 e {MAX_PORT}")
+        if query == cls():
+            raise ValueError("Informe ao menos um filtro")
+        return query
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Forma canônica da consulta, ecoada na resposta"""
+        data = asdict(self)
+        data['countries'] = sorted(self.countries)
+        data['flags'] = sorted(self.flags)
+        return data
+
+
+def execute_query(index: NodeIndex, query: NodeQuery) -> array:
+    """Retorna as linhas (em ordem) que satisfazem a consulta.
+
+    O planejador parte do menor conjunto candidato entre os índices
+    disponíveis (países, cada flag, AS, porta aceita pela política de
+    saída) e avalia os demais predicados
+    direto nas colunas, do mais barato ao mais caro. Sem filtro indexado,
+    percorre o store inteiro.
+    """
+    store = index.store
+
+    candidates: List[array] = []
+    if query.countries:
+        rows = array('I')
+        for country in query.countries:
+            rows.extend(index.country(country))
+        candidates.append(array('I', sorted(rows)))
+    for flag in query.flags:
+        candidates.append(index.flag(flag))
+    if query.as_name is not None:
+        candidates.append(index.as_name(query.as_name))
+    port_rows = None
+    if query.port is not None:
+        # Resultado memoizado do PortPolicyIndex: nenhuma política é recompilada
+        port_rows = index.port(query.port)
+        candidates.append(port_rows)
+
+    if candidates:
+        rows = min(candidates, key=len)
+        if not rows:
+            return array('I')
+    else:
+        rows = range(len(store))
+
+    # Predicados residuais sobre as colunas (ids e inteiros, sem montar dicts)
+    checks = []
+
+    if query.flags:
+        required = 0
+        for flag in query.flags:
+            required |= store.flag_bit(flag)
+        flag_mask = store.flag_mask
+        checks.append(lambda row: flag_mask[row] & required == required)
+
+    if query.as_name is not None:
+        as_id = store.as_names.id_of(query.as_name)
+        as_column = store.as_name
+        checks.append(lambda row: as_column[row] == as_id)
+
+    if query.countries:
+        country_ids = frozenset(
+            country_id for country_id, name in enumerate(store.countries.values)
+            if (name or 'Unknown').upper() in query.countries
+        )
+        country_column = store.country
+        checks.append(lambda row: country_column[row] in country_ids)
+
+    if port_rows is not None and rows is not port_rows:
+        accepted = frozenset(port_rows)
+        checks.append(lambda row: row in accepted)
+
+    if query.min_bandwidth is not None or query.max_bandwidth is not None:
+        low = query.min_bandwidth or 0
+        high = query.max_bandwidth
+        bandwidth = store.bandwidth
+        if high is None:
+            checks.append(lambda row: bandwidth[row] >= low)
+        else:
+            checks.append(lambda row: low <= bandwidth[row] <= high)
+
+    if query.first_seen_after is not None or query.first_seen_before is not None:
+        # Datas no formato do Onionoo: a ordem lexicográfica é a cronológica
+        after = query.first_seen_after or ''
+        before = query.first_seen_before
+        strings = store.strings
+        first_seen = store.first_seen
+
+        def check_first_seen(row: int) -> bool:
+            value = strings[first_seen[row]]
+            return bool(value) and value >= after and (before is None or value <= before)
+        checks.append(check_first_seen)
+
+    result = array('I')
+    for row in rows:
+        for check in checks:
+            if not check(row):
+                break
+        else:
+            result.append(row)
+    return result
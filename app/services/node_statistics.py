@@ -0,0 +1,122 @@
+"""
+Estatísticas agregadas dos nós Tor, calculadas uma vez por snapshot
+"""
+
+from array import array
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Tuple
+
+from services.relay_store import RelayStore
+
+# Percentis de bandwidth expostos em /api/stats
+BANDWIDTH_PERCENTILES = (50, 90, 99)
+
+
+@dataclass(frozen=True)
+class NodeStatistics:
+    """Agregados imutáveis de um snapshot detalhado"""
+    total_nodes: int = 0
+    running_nodes: int = 0
+    exit_nodes: int = 0
+    total_bandwidth: int = 0
+    countries: Tuple[Tuple[str, int], ...] = ()
+    flags_distribution: Mapping[str, int] = field(default_factory=lambda: MappingProxyType({}))
+    flags_bandwidth: Mapping[str, int] = field(default_factory=lambda: MappingProxyType({}))
+    bandwidth_percentiles: Mapping[str, int] = field(default_factory=lambda: MappingProxyType({}))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Converte para o formato retornado por ``/api/stats``"""
+        return {
+            'total_nodes': self.total_nodes,
+            'running_nodes': self.running_nodes,
+            'offline_nodes': self.total_nodes - self.running_nodes,
+            'exit_nodes': self.exit_nodes,
+            'total_bandwidth': self.total_bandwidth,
+            'countries_count': len(self.countries),
+            'top_countries': [list(item) for item in self.countries[:10]],
+            'flags_distribution': dict(self.flags_distribution),
+            'flags_bandwidth': dict(self.flags_bandwidth),
+            'bandwidth_percentiles': dict(self.bandwidth_percentiles)
+        }
+
+
+class StatisticsBuilder:
+    """Acumula os agregados linha a linha durante a ingestão de um snapshot.
+
+    Trabalha sobre os ids internados do ``RelayStore``: contagens por país e
+    por máscara de flags são somadas como inteiros e só viram nomes no ``build``.
+    """
+
+    def __init__(self, store: RelayStore):
+        self.store = store
+        self.total_nodes = 0
+        self.running_nodes = 0
+        self.exit_nodes = 0
+        self.total_bandwidth = 0
+        self.country_count: Dict[int, int] = {}
+        self.mask_count: Dict[int, int] = {}
+        self.mask_bandwidth: Dict[int, int] = {}
+        self.bandwidths = array('Q')
+
+    def add(self, row: int) -> None:
+        """Contabiliza a linha ``row`` do store"""
+        store = self.store
+        bandwidth = store.bandwidth[row]
+        mask = store.flag_mask[row]
+        country_id = store.country[row]
+
+        self.total_nodes += 1
+        self.total_bandwidth += bandwidth
+        self.bandwidths.append(bandwidth)
+
+        if store.running[row]:
+            self.running_nodes += 1
+        if mask & store.flag_bit('Exit'):
+            self.exit_nodes += 1
+
+        self.country_count[country_id] = self.country_count.get(country_id, 0) + 1
+        self.mask_count[mask] = self.mask_count.get(mask, 0) + 1
+        self.mask_bandwidth[mask] = self.mask_bandwidth.get(mask, 0) + bandwidth
+
+    def build(self) -> NodeStatistics:
+        """Congela os agregados acumulados"""
+        store = self.store
+        bandwidths = sorted(self.bandwidths)
+        percentiles: Dict[str, int] = {}
+        if bandwidths:
+            for p in BANDWIDTH_PERCENTILES:
+                # Percentil pelo método nearest-rank
+                rank = max(1, -(-p * len(bandwidths) // 100))
+                percentiles[f"p{p}"] = bandwidths[rank - 1]
+
+        countries: Dict[str, int] = {}
+        for country_id, count in self.country_count.items():
+            country = store.countries[country_id]
+            countries[country] = countries.get(country, 0) + count
+
+        flags_count: Dict[str, int] = {}
+        flags_bandwidth: Dict[str, int] = {}
+        for mask, count in self.mask_count.items():
+            for flag in store.flag_names(mask):
+                flags_count[flag] = flags_count.get(flag, 0) + count
+                flags_bandwidth[flag] = flags_bandwidth.get(flag, 0) + self.mask_bandwidth[mask]
+
+        return NodeStatistics(
+            total_nodes=self.total_nodes,
+            running_nodes=self.running_nodes,
+            exit_nodes=self.exit_nodes,
+            total_bandwidth=self.total_bandwidth,
+            countries=tuple(sorted(countries.items(), key=lambda x: x[1], reverse=True)),
+            flags_distribution=MappingProxyType(flags_count),
+            flags_bandwidth=MappingProxyType(flags_bandwidth),
+            bandwidth_percentiles=MappingProxyType(percentiles)
+        )
+
+
+def compute_statistics(store: RelayStore) -> NodeStatistics:
+    """Calcula os agregados de todos os relays do store"""
+    builder = StatisticsBuilder(store)
+    for row in range(len(store)):
+        builder.add(row)
+    return builder.build()
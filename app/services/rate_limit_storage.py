@@ -0,0 +1,191 @@
+"""
+Armazenamento de rate limit compartilhado entre workers, em SQLite (WAL)
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from math import floor
+from typing import Iterator, Optional, Tuple
+
+from limits.storage import Storage
+
+try:
+    from limits.storage.base import SlidingWindowCounterSupport
+except ImportError:  # limits < 4.1: apenas fixed-window
+    SlidingWindowCounterSupport = object
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expiry REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+_INCR = """
+INSERT INTO counters (key, value, expiry) VALUES (?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = CASE WHEN counters.expiry <= ? THEN excluded.value ELSE counters.value + excluded.value END,
+    expiry = CASE WHEN counters.expiry <= ? THEN excluded.expiry ELSE counters.expiry END
+RETURNING value
+"""
+
+# fixed-window-elastic-expiry: todo incremento empurra a expiração da janela
+_INCR_ELASTIC = """
+INSERT INTO counters (key, value, expiry) VALUES (?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = CASE WHEN counters.expiry <= ? THEN excluded.value ELSE counters.value + excluded.value END,
+    expiry = excluded.expiry
+RETURNING value
+"""
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport):
+    """Contadores de rate limit num arquivo SQLite local, vistos por todos os workers.
+
+    URI: ``sqlite:///caminho/do/arquivo.db``. Cada incremento é um único
+    UPSERT atômico; o modo WAL com ``synchronous=OFF`` mantém o custo em
+    microssegundos (contadores perdidos numa queda do host são aceitáveis).
+    Suporta as estratégias ``fixed-window``, ``fixed-window-elastic-expiry``
+    e ``sliding-window-counter``.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    # A cada N incrementos o processo remove contadores expirados
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri[len('sqlite://'):]
+        if not self.path:
+            raise ValueError("URI sqlite:// sem caminho de arquivo")
+        self.timeout = float(options.get('timeout', 5))
+        self._local = threading.local()
+        self._pid: Optional[int] = None
+        self._increments = 0
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexão da thread atual (recriada após fork)"""
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        now = time.time()
+        connection = self._connection()
+        if elastic_expiry:
+            value = connection.execute(_INCR_ELASTIC, (key, amount, now + expiry, now)).fetchall()[0][0]
+        else:
+            value = connection.execute(_INCR, (key, amount, now + expiry, now, now)).fetchall()[0][0]
+
+        self._increments += 1
+        if self._increments % self.CLEANUP_EVERY == 0:
+            self._cleanup(connection, now)
+        return value
+
+    @staticmethod
+    def _cleanup(connection: sqlite3.Connection, now: float) -> None:
+        try:
+            connection.execute('DELETE FROM counters WHERE expiry <= ?', (now,))
+        except sqlite3.OperationalError as e:
+            logging.debug(f"Limpeza do rate limit adiada: {e}")
+
+    def _get(self, connection: sqlite3.Connection, key: str, now: float) -> Tuple[int, float]:
+        row = connection.execute(
+            'SELECT value, expiry FROM counters WHERE key = ? AND expiry > ?', (key, now)
+        ).fetchone()
+        return (row[0], row[1]) if row else (0, now)
+
+    def get(self, key: str) -> int:
+        return self._get(self._connection(), key, time.time())[0]
+
+    def get_expiry(self, key: str) -> float:
+        return self._get(self._connection(), key, time.time())[1]
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute('SELECT 1').fetchall()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        return self._connection().execute('DELETE FROM counters').rowcount
+
+    def clear(self, key: str) -> None:
+        self._connection().execute('DELETE FROM counters WHERE key = ?', (key,))
+
+    # sliding-window-counter: contadores das janelas atual e anterior, alinhadas ao epoch
+
+    @staticmethod
+    def _window_keys(key: str, expiry: int, now: float) -> Tuple[str, str]:
+        window = int(now // expiry)
+        return f"{key}/{window - 1}", f"{key}/{window}"
+
+    def _sliding_window(
+        self,
+        connection: sqlite3.Connection,
+        key: str,
+        expiry: int,
+        now: float
+    ) -> Tuple[int, float, int, float]:
+        previous_key, current_key = self._window_keys(key, expiry, now)
+        previous_count = self._get(connection, previous_key, now)[0]
+        current_count = self._get(connection, current_key, now)[0]
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+
+        now = time.time()
+        # Leitura e incremento na mesma transação: sem corrida entre workers
+        with self._transaction() as connection:
+            previous_count, previous_ttl, current_count, _ = self._sliding_window(
+                connection, key, expiry, now
+            )
+            if floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+                return False
+            current_key = self._window_keys(key, expiry, now)[1]
+            connection.execute(_INCR, (current_key, amount, now + 2 * expiry, now, now)).fetchall()
+        return True
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        return self._sliding_window(self._connection(), key, expiry, time.time())
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        previous_key, current_key = self._window_keys(key, expiry, time.time())
+        self._connection().execute(
+            'DELETE FROM counters WHERE key IN (?, ?)', (previous_key, current_key)
+        )
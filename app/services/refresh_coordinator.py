@@ -0,0 +1,48 @@
+"""
+Coordenação das atualizações upstream entre processos (workers do gunicorn)
+"""
+
+import fcntl
+import logging
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class RefreshCoordinator:
+    """Elege um único processo para buscar cada fonte upstream.
+
+    Cada fonte tem um arquivo de lock em ``CACHE_DIR``. O processo que obtém
+    o ``flock`` exclusivo busca e processa os dados; os demais não esperam e
+    apenas recarregam o resultado persistido em disco. O lock é liberado pelo
+    kernel se o processo morrer, funcionando como um lease.
+    """
+
+    def __init__(self, lock_dir: str):
+        self.lock_dir = lock_dir
+
+    def _lock_path(self, source: str) -> str:
+        return os.path.join(self.lock_dir, f"tor_refresh_{source}.lock")
+
+    def state_path(self, source: str) -> str:
+        """Arquivo de estado da fonte compartilhado entre processos (ex.: circuito)"""
+        return os.path.join(self.lock_dir, f"tor_circuit_{source}.json")
+
+    @contextmanager
+    def lead(self, source: str) -> Iterator[bool]:
+        """Tenta assumir a atualização da fonte; produz ``True`` se este processo lidera"""
+        fd = os.open(self._lock_path(source), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logging.debug(f"Atualização de '{source}' em andamento em outro processo")
+                yield False
+                return
+
+            try:
+                yield True
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
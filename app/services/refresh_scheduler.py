@@ -0,0 +1,93 @@
+"""
+Agendamento concorrente das atualizações de cada fonte upstream
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+
+@dataclass
+class RefreshJob:
+    """Tarefa periódica de uma fonte e seu estado de agendamento"""
+    name: str
+    refresh: Callable[[], Any]
+    interval: float
+    next_run: float = 0.0
+    running: Optional[Future] = None
+
+
+class RefreshScheduler:
+    """Executa a atualização de cada fonte em sua própria thread e cadência.
+
+    Uma fonte lenta ou com falha ocupa apenas a própria thread: as demais
+    continuam sendo verificadas no seu intervalo. Cada fonte tem no máximo
+    uma execução em andamento; o próximo ciclo é agendado ``interval``
+    segundos após o término da anterior, com sucesso ou erro.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, RefreshJob] = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def add(self, name: str, refresh: Callable[[], Any], interval: float) -> None:
+        """Registra uma fonte; deve ser chamado antes de ``start``"""
+        self.jobs[name] = RefreshJob(name=name, refresh=refresh, interval=interval)
+
+    def trigger(self, name: str) -> None:
+        """Antecipa o próximo ciclo da fonte, sem esperar por ele.
+
+        Sem efeito se a fonte já estiver em atualização.
+        """
+        job = self.jobs.get(name)
+        if job is None or job.running is not None:
+            return
+        job.next_run = 0.0
+        self._wakeup.set()
+
+    def start(self) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self.jobs)),
+            thread_name_prefix='tor-refresh'
+        )
+        self._thread = threading.Thread(target=self._run, name='tor-refresh-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Interrompe o agendamento sem esperar buscas em andamento"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            now = time.monotonic()
+            wait = 60.0
+
+            for job in self.jobs.values():
+                if job.running is not None:
+                    continue
+                if now >= job.next_run:
+                    job.running = self._executor.submit(job.refresh)
+                    job.running.add_done_callback(lambda future, job=job: self._finished(job, future))
+                else:
+                    wait = min(wait, job.next_run - now)
+
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+    def _finished(self, job: RefreshJob, future: Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logging.error(f"Erro ao atualizar fonte '{job.name}': {future.exception()}")
+        job.next_run = time.monotonic() + job.interval
+        job.running = None
+        self._wakeup.set()
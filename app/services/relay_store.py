@@ -0,0 +1,260 @@
+"""
+Armazenamento compacto (colunar) dos relays Tor
+"""
+
+import logging
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from services.exit_policy import policy_summary
+
+
+# Colunas do store (nome, typecode do ``array``) e tabelas de strings internadas
+COLUMNS = (
+    ('nickname', 'I'),
+    ('fingerprint', 'I'),
+    ('addresses', 'I'),
+    ('running', 'B'),
+    ('flag_mask', 'Q'),
+    ('flag_list', 'I'),
+    ('bandwidth', 'Q'),
+    ('country', 'I'),
+    ('as_name', 'I'),
+    ('first_seen', 'I'),
+    ('last_seen', 'I'),
+    ('or_addresses', 'I'),
+    ('exit_addresses', 'I'),
+    ('consensus_weight', 'Q'),
+    ('exit_policy', 'I'),
+)
+TABLES = ('strings', 'countries', 'as_names', 'flags', 'policies')
+
+# Bits da máscara de flags; flags distintas além disso ficam só na lista do relay
+MAX_MASK_FLAGS = 64
+
+# Campos públicos de um relay, na ordem de ``to_dict``
+SUMMARY_FIELDS = (
+    'nickname', 'fingerprint', 'addresses', 'running', 'flags', 'bandwidth',
+    'country', 'as_name', 'first_seen', 'last_seen', 'exit_node'
+)
+# Campos que só o documento /details do Onionoo traz (ONIONOO_DETAILS)
+DETAILS_FIELDS = ('or_addresses', 'exit_addresses', 'consensus_weight', 'exit_policy_summary')
+NODE_FIELDS = SUMMARY_FIELDS + DETAILS_FIELDS
+
+
+class StringTable:
+    """Tabela de strings internadas: cada valor distinto é guardado uma única vez"""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: List[str] = []
+        self._ids: Dict[str, int] = {}
+        for value in values:
+            self.intern(value)
+
+    def intern(self, value: str) -> int:
+        """Retorna o id do valor, adicionando-o à tabela se necessário"""
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = len(self.values)
+            self._ids[value] = string_id
+            self.values.append(value)
+        return string_id
+
+    def id_of(self, value: str) -> Optional[int]:
+        """Retorna o id do valor sem adicioná-lo"""
+        return self._ids.get(value)
+
+    def __getitem__(self, string_id: int) -> str:
+        return self.values[string_id]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class RelayStore:
+    """Relays em colunas paralelas de inteiros, com strings internadas.
+
+    País, AS e flags são codificados como ids de tabelas pequenas; as flags
+    de cada relay viram uma máscara de bits (para filtros e agregados) e a
+    lista original, na ordem do upstream, é internada como string. A
+    política de saída vira o id do seu texto canônico. Dicionários só são montados na serialização
+    (``to_dict``/``iter_dicts``); os ``DETAILS_FIELDS`` só aparecem neles
+    quando os relays vieram do documento /details (``details``).
+    """
+
+    def __init__(self):
+        for name in TABLES:
+            setattr(self, name, StringTable())
+        for name, typecode in COLUMNS:
+            setattr(self, name, array(typecode))
+        self.details = False
+
+        self._mask_names: Dict[int, List[str]] = {}
+        self._policy_summaries: Dict[int, Optional[Dict[str, List[str]]]] = {}
+
+    @classmethod
+    def from_columns(
+        cls,
+        tables: Dict[str, Any],
+        columns: Dict[str, Any],
+        details: bool = False
+    ) -> 'RelayStore':
+        """Monta um store somente leitura sobre tabelas e colunas já existentes (ex.: mmap)"""
+        store = cls.__new__(cls)
+        for name in TABLES:
+            setattr(store, name, tables[name])
+        for name, _ in COLUMNS:
+            setattr(store, name, columns[name])
+        store.details = details
+        store._mask_names = {}
+        store._policy_summaries = {}
+        return store
+
+    def __len__(self) -> int:
+        return len(self.fingerprint)
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        """Campos públicos disponíveis neste store"""
+        return NODE_FIELDS if self.details else SUMMARY_FIELDS
+
+    def flag_bit(self, flag: str) -> int:
+        """Bit da flag na máscara (0 se a flag não aparece no snapshot ou não coube nela)"""
+        flag_id = self.flags.id_of(flag)
+        return 0 if flag_id is None or flag_id >= MAX_MASK_FLAGS else 1 << flag_id
+
+    def _mask_for(self, flags: Iterable[str]) -> int:
+        mask = 0
+        for flag in flags:
+            flag_id = self.flags.id_of(flag)
+            if flag_id is None:
+                if len(self.flags) >= MAX_MASK_FLAGS:
+                    # Não aborta a ingestão: a flag só não é filtrável nem contabilizada
+                    logging.warning(f"Mais de {MAX_MASK_FLAGS} flags distintas; '{flag}' fica fora da máscara")
+                    self.flags.intern(flag)
+                    continue
+                flag_id = self.flags.intern(flag)
+            if flag_id < MAX_MASK_FLAGS:
+                mask |= 1 << flag_id
+        return mask
+
+    def flag_names(self, mask: int) -> List[str]:
+        """Flags presentes numa máscara de bits, em ordem alfabética (para agregados)"""
+        names = self._mask_names.get(mask)
+        if names is None:
+            names = sorted(
+                flag for flag_id, flag in enumerate(self.flags.values) if mask & (1 << flag_id)
+            )
+            self._mask_names[mask] = names
+        return list(names)
+
+    def exit_policy_summary(self, policy_id: int) -> Optional[Dict[str, List[str]]]:
+        """``exit_policy_summary`` no formato do Onionoo (``None`` se desconhecida)"""
+        if policy_id not in self._policy_summaries:
+            self._policy_summaries[policy_id] = policy_summary(self.policies[policy_id])
+        summary = self._policy_summaries[policy_id]
+        return None if summary is None else {action: list(ports) for action, ports in summary.items()}
+
+    @staticmethod
+    def _split(value: str) -> List[str]:
+        return value.split(' ') if value else []
+
+    def append(self, node: Any) -> None:
+        """Adiciona um relay (objeto com os atributos de ``TorNodeData``)"""
+        strings = self.strings
+        self.nickname.append(strings.intern(node.nickname))
+        self.fingerprint.append(strings.intern(node.fingerprint))
+        self.addresses.append(strings.intern(' '.join(node.addresses)))
+        self.running.append(1 if node.running else 0)
+        self.flag_mask.append(self._mask_for(node.flags))
+        self.flag_list.append(strings.intern(' '.join(node.flags)))
+        self.bandwidth.append(node.bandwidth or 0)
+        self.country.append(self.countries.intern(node.country))
+        self.as_name.append(self.as_names.intern(node.as_name))
+        self.first_seen.append(strings.intern(node.first_seen))
+        self.last_seen.append(strings.intern(node.last_seen))
+        self.or_addresses.append(strings.intern(' '.join(node.or_addresses)))
+        self.exit_addresses.append(strings.intern(' '.join(node.exit_addresses)))
+        self.consensus_weight.append(node.consensus_weight or 0)
+        self.exit_policy.append(self.policies.intern(node.exit_policy))
+        if node.details:
+            self.details = True
+
+    def to_dict(self, row: int) -> Dict[str, Any]:
+        """Monta o dicionário público de um relay (fronteira de serialização)"""
+        strings = self.strings
+        mask = self.flag_mask[row]
+        node = {
+            'nickname': strings[self.nickname[row]],
+            'fingerprint': strings[self.fingerprint[row]],
+            'addresses': self._split(strings[self.addresses[row]]),
+            'running': bool(self.running[row]),
+            'flags': self._split(strings[self.flag_list[row]]),
+            'bandwidth': self.bandwidth[row],
+            'country': self.countries[self.country[row]],
+            'as_name': self.as_names[self.as_name[row]],
+            'first_seen': strings[self.first_seen[row]],
+            'last_seen': strings[self.last_seen[row]],
+            'exit_node': bool(mask & self.flag_bit('Exit')),
+        }
+        if self.details:
+            node['or_addresses'] = self._split(strings[self.or_addresses[row]])
+            node['exit_addresses'] = self._split(strings[self.exit_addresses[row]])
+            node['consensus_weight'] = self.consensus_weight[row]
+            node['exit_policy_summary'] = self.exit_policy_summary(self.exit_policy[row])
+        return node
+
+    def _field_getter(self, field: str) -> Callable[[int], Any]:
+        strings = self.strings
+        if field in ('addresses', 'or_addresses', 'exit_addresses'):
+            column = getattr(self, field)
+            return lambda row: self._split(strings[column[row]])
+        if field == 'consensus_weight':
+            return self.consensus_weight.__getitem__
+        if field == 'exit_policy_summary':
+            return lambda row: self.exit_policy_summary(self.exit_policy[row])
+        if field == 'running':
+            return lambda row: bool(self.running[row])
+        if field == 'flags':
+            return lambda row: self._split(strings[self.flag_list[row]])
+        if field == 'bandwidth':
+            return self.bandwidth.__getitem__
+        if field == 'country':
+            return lambda row: self.countries[self.country[row]]
+        if field == 'as_name':
+            return lambda row: self.as_names[self.as_name[row]]
+        if field == 'exit_node':
+            exit_bit = self.flag_bit('Exit')
+            return lambda row: bool(self.flag_mask[row] & exit_bit)
+        column = getattr(self, field)
+        return lambda row: strings[column[row]]
+
+    def projector(self, fields: Sequence[str]) -> Callable[[int], Dict[str, Any]]:
+        """Retorna uma função que monta o dicionário de uma linha só com ``fields``.
+
+        Apenas as colunas pedidas são lidas e decodificadas.
+        """
+        unknown = [field for field in fields if field not in NODE_FIELDS]
+        if unknown:
+            raise ValueError(f"Campos desconhecidos: {', '.join(unknown)}")
+        unavailable = [field for field in fields if field not in self.fields]
+        if unavailable:
+            raise ValueError(f"Campos disponíveis apenas com ONIONOO_DETAILS: {', '.join(unavailable)}")
+
+        getters = [(field, self._field_getter(field)) for field in fields]
+        return lambda row: {field: getter(row) for field, getter in getters}
+
+    def iter_dicts(
+        self,
+        rows: Optional[Iterable[int]] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Itera dicionários dos relays (todos, ou apenas das linhas informadas)"""
+        if rows is None:
+            rows = range(len(self))
+        build = self.to_dict if fields is None else self.projector(fields)
+        for row in rows:
+            yield build(row)
+
+    def to_dicts(self, rows: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        return list(self.iter_dicts(rows))
@@ -0,0 +1,170 @@
+"""
+Snapshot binário dos relays, mapeado em memória e compartilhado entre workers
+"""
+
+import json
+import mmap
+import struct
+import sys
+import traceback
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from services.relay_store import COLUMNS, TABLES, RelayStore
+
+# magic, versão do snapshot, número de relays, tamanho do bloco de metadados
+MAGIC = b'TORSNAP3'
+HEADER = struct.Struct('<8sQII')
+ALIGN = 8
+
+
+@dataclass
+class Snapshot:
+    """Snapshot aberto: store somente leitura sobre o mmap e seus metadados"""
+    store: RelayStore
+    version: int
+    validators: Dict[str, str]
+
+
+class MappedStringTable:
+    """Tabela de strings lida diretamente do mmap (offsets + blob UTF-8)"""
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self._offsets = offsets
+        self._blob = blob
+        self._values: Optional[List[str]] = None
+        self._ids: Optional[Dict[str, int]] = None
+
+    def __getitem__(self, string_id: int) -> str:
+        return str(self._blob[self._offsets[string_id]:self._offsets[string_id + 1]], 'utf-8')
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @property
+    def values(self) -> List[str]:
+        """Todos os valores decodificados (usado apenas para tabelas pequenas)"""
+        if self._values is None:
+            self._values = [self[i] for i in range(len(self))]
+        return self._values
+
+    def id_of(self, value: str) -> Optional[int]:
+        if self._ids is None:
+            self._ids = {v: i for i, v in enumerate(self.values)}
+        return self._ids.get(value)
+
+
+def encode_snapshot(store: RelayStore, version: int, validators: Dict[str, str]) -> bytes:
+    """Serializa o store no formato binário versionado"""
+    sections: List[bytes] = []
+    offset = 0
+
+    def add(blob: bytes) -> int:
+        nonlocal offset
+        start = offset
+        padding = (-len(blob)) % ALIGN
+        sections.append(blob)
+        sections.append(b'\0' * padding)
+        offset += len(blob) + padding
+        return start
+
+    meta: Dict[str, Any] = {
+        'byteorder': sys.byteorder,
+        'validators': validators,
+        'details': store.details,
+        'columns': {},
+        'tables': {}
+    }
+
+    for name, typecode in COLUMNS:
+        column = getattr(store, name)
+        data = column.tobytes() if isinstance(column, array) else bytes(column)
+        meta['columns'][name] = [add(data), typecode, len(column)]
+
+    for name in TABLES:
+        encoded = [(value or '').encode('utf-8') for value in getattr(store, name).values]
+        offsets = array('I', [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        blob = b''.join(encoded)
+        meta['tables'][name] = [add(offsets.tobytes()), len(offsets), add(blob), len(blob)]
+
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    header = HEADER.pack(MAGIC, version, len(store), len(meta_bytes))
+    head = header + meta_bytes
+    head += b'\0' * ((-len(head)) % ALIGN)
+    return head + b''.join(sections)
+
+
+def read_snapshot_version(path: str) -> Optional[int]:
+    """Lê apenas o cabeçalho e retorna a versão do snapshot (``None`` se inválido)"""
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        return None
+    magic, version, _, _ = HEADER.unpack(raw)
+    return version if magic == MAGIC else None
+
+
+def open_snapshot(path: str) -> Snapshot:
+    """Mapeia o snapshot em memória e monta um ``RelayStore`` sem copiar os dados.
+
+    Um arquivo vazio, truncado ou de outro formato levanta ``ValueError``
+    (o mapeamento é fechado antes).
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        return _map_snapshot(mapped, path)
+    except BaseException as e:
+        # As views da tentativa ficam presas nos frames do traceback até serem limpos
+        traceback.clear_frames(e.__traceback__)
+        try:
+            mapped.close()
+        except BufferError:
+            pass
+        if isinstance(e, (struct.error, TypeError, IndexError)):
+            raise ValueError(f"Snapshot inválido: {path} ({e})") from None
+        raise
+
+
+def _section(view: memoryview, start: int, size: int) -> memoryview:
+    """Fatia do mmap, validando que ela cabe no arquivo"""
+    if start < 0 or size < 0 or start + size > len(view):
+        raise ValueError("Snapshot truncado")
+    return view[start:start + size]
+
+
+def _map_snapshot(mapped: mmap.mmap, path: str) -> Snapshot:
+    view = memoryview(mapped)
+    if len(view) < HEADER.size:
+        raise ValueError(f"Snapshot truncado: {path}")
+    magic, version, count, meta_len = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f"Snapshot inválido: {path}")
+
+    meta = json.loads(bytes(_section(view, HEADER.size, meta_len)))
+    if meta['byteorder'] != sys.byteorder:
+        raise ValueError(f"Snapshot com byteorder incompatível: {meta['byteorder']}")
+
+    base = HEADER.size + meta_len
+    base += (-base) % ALIGN
+
+    columns = {}
+    for name, (offset, typecode, length) in meta['columns'].items():
+        itemsize = array(typecode).itemsize
+        start = base + offset
+        columns[name] = _section(view, start, length * itemsize).cast(typecode)
+        if len(columns[name]) != count:
+            raise ValueError(f"Coluna '{name}' inconsistente no snapshot")
+
+    tables = {}
+    for name, (offsets_at, offsets_len, blob_at, blob_len) in meta['tables'].items():
+        offsets = _section(view, base + offsets_at, offsets_len * 4).cast('I')
+        blob = _section(view, base + blob_at, blob_len)
+        tables[name] = MappedStringTable(offsets, blob)
+
+    store = RelayStore.from_columns(tables, columns, details=meta.get('details', False))
+    return Snapshot(store=store, version=version, validators=meta.get('validators') or {})
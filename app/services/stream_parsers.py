@@ -0,0 +1,107 @@
+"""
+Parsers incrementais para as fontes upstream (exit-addresses e Onionoo)
+
+Consomem o corpo em blocos (``iter_content``) e emitem um registro por vez,
+de modo que o pico de memória é proporcional a um registro, não ao documento.
+"""
+
+import codecs
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+_JSON_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[\s,]*')
+_RELAYS_KEY = re.compile(r'"relays"\s*:\s*\[')
+# Trecho mantido entre blocos na busca da chave (cobre espaços entre chave e array)
+_KEY_SEARCH_TAIL = 4096
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Divide um fluxo de blocos de bytes em linhas de texto"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        yield from lines
+
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def iter_exit_addresses(chunks: Iterable[bytes]) -> Iterator[Tuple[str, str]]:
+    """Emite pares ``(ip, último_visto)`` das linhas ``ExitAddress`` do exit-addresses"""
+    for line in iter_lines(chunks):
+        if line.startswith('ExitAddress'):
+            parts = line.split()
+            if len(parts) >= 3:
+                yield parts[1], ' '.join(parts[2:])
+
+
+def iter_json_array_items(chunks: Iterable[bytes], key_pattern: 're.Pattern') -> Iterator[Any]:
+    """Emite, um a um, os itens do array JSON cujo início casa com ``key_pattern``.
+
+    O buffer guarda apenas o trecho ainda não consumido; cada item é decodificado
+    com ``raw_decode`` assim que estiver completo no buffer.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = None
+    exhausted = False
+
+    def read_more() -> bool:
+        nonlocal buffer, exhausted
+        if exhausted:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buffer += decoder.decode(b'', final=True)
+            return False
+        buffer += decoder.decode(chunk)
+        return True
+
+    # Localiza o início do array; só a cauda já examinada fica no buffer, para
+    # casar chaves divididas entre dois blocos
+    while pos is None:
+        match = key_pattern.search(buffer)
+        if match:
+            pos = match.end()
+            break
+        buffer = buffer[-_KEY_SEARCH_TAIL:]
+        if not read_more():
+            raise ValueError("Array JSON não encontrado no documento")
+
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos >= len(buffer):
+            buffer, pos = '', 0
+            if not read_more():
+                raise ValueError("Array JSON truncado")
+            continue
+
+        if buffer[pos] == ']':
+            return
+
+        try:
+            item, end = _JSON_DECODER.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Item incompleto: descarta o que já foi consumido e lê mais
+            buffer, pos = buffer[pos:], 0
+            if not read_more():
+                raise
+            continue
+
+        yield item
+        pos = end
+
+
+def iter_onionoo_relays(chunks: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """Emite os objetos de ``relays`` de um documento Onionoo, um por vez"""
+    for relay in iter_json_array_items(chunks, _RELAYS_KEY):
+        if isinstance(relay, dict):
+            yield relay
@@ -2,10 +2,14 @@
 Serviço para busca e processamento de dados dos nós Tor
 """
 
+import hashlib
 import logging
+import math
+import os
+import sys
 import threading
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Set, Tuple, Iterable, Iterator
 from datetime import datetime
 
 import requests
@@ -14,12 +18,52 @@ from requests.packages.urllib3.util.retry import Retry
 
 from config.settings import Config
 from services.cache_service import CacheService
+from services.circuit_breaker import CircuitBreaker
+from services.exit_policy import canonical_policy, policy_summary
+from services.refresh_coordinator import RefreshCoordinator
+from services.refresh_scheduler import RefreshScheduler
+from services.relay_store import RelayStore
+from services.stream_parsers import iter_exit_addresses, iter_onionoo_relays
+from utils.metrics import CIRCUIT_OPEN, REFRESH_DURATION, SNAPSHOT_AGE, UPSTREAM_FETCHES
+from utils.validators import normalize_ip_address
+
+# Tamanho dos blocos lidos das fontes upstream
+UPSTREAM_CHUNK_SIZE = 64 * 1024
+
+# Retry-After sugerido enquanto uma fonte ainda não tem nenhum snapshot
+SNAPSHOT_RETRY_AFTER_SECONDS = 30
+
+
+class SnapshotUnavailableError(RuntimeError):
+    """Nenhum snapshot da fonte foi carregado ou buscado até agora"""
+    
+    def __init__(self, source: str, retry_after: int):
+        super().__init__(f"Dados de '{source}' ainda indisponíveis; tente novamente em {retry_after}s")
+        self.source = source
+        self.retry_after = retry_after
 
 
 class TorNodeData:
-    """Classe para representar dados de um nó Tor"""
+    """Classe para representar dados de um nó Tor (documento summary ou details do Onionoo)"""
+    
+    __slots__ = (
+        'nickname', 'fingerprint', 'addresses', 'running', 'flags', 'bandwidth',
+        'country', 'as_name', 'first_seen', 'last_seen', 'exit_node',
+        'or_addresses', 'exit_addresses', 'consensus_weight', 'exit_policy', 'details'
+    )
     
     def __init__(self, relay_data: Dict[str, Any]):
+        # Só o documento details tem políticas de saída, or_addresses e consensus weight
+        self.details = 'fingerprint' in relay_data
+        if self.details:
+            self._load_details(relay_data)
+        else:
+            self._load_summary(relay_data)
+        self.country = sys.intern(self.country)
+        self.as_name = sys.intern(self.as_name)
+        self.exit_node = 'Exit' in self.flags
+    
+    def _load_summary(self, relay_data: Dict[str, Any]) -> None:
         self.nickname = relay_data.get('n', 'Unknown')
         self.fingerprint = relay_data.get('f', '')
         self.addresses = relay_data.get('a', [])
@@ -30,11 +74,33 @@ class TorNodeData:
         self.as_name = relay_data.get('as_name', 'Unknown')
         self.first_seen = relay_data.get('f_s', '')
         self.last_seen = relay_data.get('l_s', '')
-        self.exit_node = 'Exit' in self.flags
+        self.or_addresses = []
+        self.exit_addresses = []
+        self.consensus_weight = 0
+        self.exit_policy = ''
+    
+    def _load_details(self, relay_data: Dict[str, Any]) -> None:
+        self.nickname = relay_data.get('nickname', 'Unknown')
+        self.fingerprint = relay_data.get('fingerprint', '')
+        self.or_addresses = relay_data.get('or_addresses', [])
+        self.exit_addresses = relay_data.get('exit_addresses', [])
+        self.running = relay_data.get('running', False)
+        self.flags = relay_data.get('flags', [])
+        self.bandwidth = relay_data.get('advertised_bandwidth', 0)
+        self.country = relay_data.get('country', 'Unknown')
+        self.as_name = relay_data.get('as_name', 'Unknown')
+        self.first_seen = relay_data.get('first_seen', '')
+        self.last_seen = relay_data.get('last_seen', '')
+        self.consensus_weight = relay_data.get('consensus_weight', 0)
+        self.exit_policy = canonical_policy(relay_data.get('exit_policy_summary'))
+        
+        # Endereços sem porta (ORPort) e sem duplicatas, como no summary
+        addresses = [address.rsplit(':', 1)[0] for address in self.or_addresses]
+        self.addresses = list(dict.fromkeys(addresses + self.exit_addresses))
     
     def to_dict(self) -> Dict[str, Any]:
-        """Converte para dicionário"""
-        return {
+        """Converte para dicionário (campos do details apenas quando presentes)"""
+        data = {
             'nickname': self.nickname,
             'fingerprint': self.fingerprint,
             'addresses': self.addresses,
@@ -45,8 +111,14 @@ class TorNodeData:
             'as_name': self.as_name,
             'first_seen': self.first_seen,
             'last_seen': self.last_seen,
-            'exit_node': self.exit_node
+            'exit_node': self.exit_node,
         }
+        if self.details:
+            data['or_addresses'] = self.or_addresses
+            data['exit_addresses'] = self.exit_addresses
+            data['consensus_weight'] = self.consensus_weight
+            data['exit_policy_summary'] = policy_summary(self.exit_policy)
+        return data
 
 
 class TorService:
@@ -56,11 +128,29 @@ class TorService:
         self.cache_service = cache_service
         self.request_timeout = request_timeout
         self.sources = Config.get_tor_sources()
-        self.session = self._create_session()
-        self._background_thread: Optional[threading.Thread] = None
-        self._stop_background = threading.Event()
-        
-        self._start_background_updater()
+        self.source_settings = Config.get_tor_source_settings()
+        # Uma sessão por fonte: as buscas rodam em threads independentes
+        self.sessions = {source: self._create_session() for source in self.sources}
+        self.coordinator = RefreshCoordinator(Config.CACHE_DIR)
+        self.scheduler: Optional[RefreshScheduler] = None
+        self._scheduler_pid: Optional[int] = None
+        self._scheduler_lock = threading.Lock()
+        # Um circuito por fonte para todos os workers, persistido ao lado do lock
+        self.breakers = {
+            source: CircuitBreaker(
+                source,
+                failure_threshold=Config.CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=Config.CIRCUIT_RESET_SECONDS,
+                state_path=self.coordinator.state_path(source)
+            )
+            for source in self.sources
+        }
+        # Fontes vencidas consultadas pela requisição em andamento (por thread)
+        self._request_state = threading.local()
+        SNAPSHOT_AGE.set_function(self._snapshot_ages)
+        CIRCUIT_OPEN.set_function(
+            lambda: {(source,): int(breaker.is_open()) for source, breaker in self.breakers.items()}
+        )
     
     def _create_session(self) -> requests.Session:
         """Cria uma sessão HTTP com retry e timeout configurados"""
@@ -78,64 +168,279 @@ class TorService:
         
         return session
     
-    def _start_background_updater(self) -> None:
-        """Inicia thread de atualização em background"""
-        self._background_thread = threading.Thread(
-            target=self._background_updater,
-            daemon=True
-        )
-        self._background_thread.start()
-        logging.info("Background updater iniciado")
+    def start_background_updater(self) -> None:
+        """Inicia a atualização em background deste processo, uma thread por fonte.
+        
+        Idempotente e chamado após o fork (em cada worker): com ``--preload``
+        o processo mestre não inicia threads, e um agendador herdado do pai
+        não sobrevive ao fork.
+        """
+        pid = os.getpid()
+        if self._scheduler_pid == pid:
+            return
+        with self._scheduler_lock:
+            if self._scheduler_pid == pid:
+                return
+            self._scheduler_pid = pid
+            self._start_scheduler()
     
-    def _background_updater(self) -> None:
-        """Atualiza caches em background"""
-        while not self._stop_background.is_set():
-            try:
-                if self.cache_service.needs_detailed_cache_update():
-                    self.fetch_detailed_nodes()
-                
-                if self.cache_service.needs_exit_cache_update():
-                    self.fetch_exit_nodes()
-                    
-            except Exception as e:
-                logging.error(f"Erro no background updater: {e}")
-            
-            # Aguarda 60 segundos antes da próxima verificação
-            self._stop_background.wait(60)
+    def _start_scheduler(self) -> None:
+        refreshers = {
+            'onionoo': self.refresh_detailed_nodes,
+            'exit_addresses': self.refresh_exit_nodes,
+        }
+        
+        self.scheduler = RefreshScheduler()
+        for source in self.sources:
+            if source not in refreshers:
+                logging.warning(f"Fonte '{source}' sem rotina de atualização; ignorada")
+                continue
+            self.scheduler.add(source, refreshers[source], self.source_settings[source]['interval'])
+        
+        self.scheduler.start()
+        logging.info(f"Background updater iniciado: {', '.join(self.scheduler.jobs)}")
     
     def stop_background_updater(self) -> None:
         """Para o background updater"""
-        self._stop_background.set()
-        if self._background_thread:
-            self._background_thread.join()
+        if self.scheduler:
+            self.scheduler.stop()
+    
+    def _snapshot_ages(self) -> Dict[Tuple[str, ...], float]:
+        """Idade (segundos) do snapshot de cada fonte, para o gauge de métricas"""
+        ages = {}
+        exit_timestamp = self.cache_service.get_exit_cache_timestamp()
+        if exit_timestamp is not None:
+            ages[('exit_addresses',)] = time.time() - exit_timestamp
+        
+        last_updated = self.cache_service.detailed_cache['last_updated']
+        if last_updated is not None:
+            ages[('onionoo',)] = (datetime.utcnow() - last_updated).total_seconds()
+        return ages
+    
+    @staticmethod
+    def _fetch_trigger() -> str:
+        """Origem da busca: thread do agendador ou caminho de uma requisição"""
+        return 'background' if threading.current_thread().name.startswith('tor-refresh') else 'request'
+    
+    @staticmethod
+    def _observe_transfer(source: str, elapsed: float, timings: Dict[str, float]) -> None:
+        """Separa o tempo de leitura do corpo entre espera pela rede e parsing"""
+        REFRESH_DURATION.observe(timings['download'], source, 'download')
+        REFRESH_DURATION.observe(max(0.0, elapsed - timings['download']), source, 'parse')
+    
+    def _source_timeout(self, source: str) -> int:
+        return self.source_settings.get(source, {}).get('timeout', self.request_timeout)
+    
+    def _refresh_source(self, source: str, needs_update: Callable[[], bool], fetch: Callable[[], Any]) -> bool:
+        """Busca a fonte somente se este processo for eleito líder.
+        
+        Os demais workers não esperam: seguem com o que já está em disco e
+        recebem o resultado quando o líder o publicar. Com o circuito da
+        fonte aberto nada é buscado (mas ``needs_update`` ainda adota o que
+        outro worker publicou). Retorna ``True`` se houve busca upstream
+        neste processo.
+        """
+        breaker = self.breakers[source]
+        if not needs_update() or breaker.is_open():
+            return False
+        
+        with self.coordinator.lead(source) as leader:
+            # Revalida após o lock: outro worker pode ter acabado de atualizar
+            if not leader or not needs_update() or not breaker.allow():
+                return False
+            try:
+                fetch()
+            except Exception:
+                breaker.record_failure()
+                raise
+            breaker.record_success()
+            return True
+    
+    def revalidate(self, source: str) -> bool:
+        """Indica se o snapshot da fonte está vencido, sem buscar nada upstream.
+        
+        Vencido, ele continua sendo servido e a atualização é antecipada no
+        agendador em background. Um snapshot detalhado publicado por outro
+        worker também é adotado (mapeado, indexado, feeds preparados) pela
+        thread de atualização: a requisição custa só um ``stat``. A exceção
+        é um processo ainda sem nenhum dado, que adota na própria requisição
+        em vez de responder 503. A fonte fica registrada para
+        ``take_stale_sources``.
+        """
+        if source == 'onionoo':
+            if self.cache_service.detailed_snapshot_changed():
+                if not self.has_snapshot(source):
+                    self.cache_service.sync_detailed_cache()
+                elif self.scheduler:
+                    self.scheduler.trigger(source)
+            stale = self.cache_service.needs_detailed_cache_update()
+        else:
+            stale = self.cache_service.needs_exit_cache_update()
+        
+        if stale:
+            consulted = getattr(self._request_state, 'stale', None)
+            if consulted is None:
+                consulted = self._request_state.stale = set()
+            consulted.add(source)
+            if self.scheduler and not self.breakers[source].is_open():
+                self.scheduler.trigger(source)
+        return stale
+    
+    def has_snapshot(self, source: str) -> bool:
+        """Indica se a fonte já tem algum snapshot instalado, mesmo vencido"""
+        if source == 'onionoo':
+            return self.cache_service.detailed_cache['version'] is not None
+        return self.cache_service.get_exit_cache_timestamp() is not None
+    
+    def require_snapshot(self, source: str) -> None:
+        """Levanta ``SnapshotUnavailableError`` se a fonte ainda não tem snapshot.
+        
+        Acontece num início a frio enquanto a primeira busca não termina
+        (upstream fora ou circuito aberto prolongam a espera). Uma lista
+        vazia servida como atual faria os consumidores descartarem os dados
+        que já têm.
+        """
+        if self.has_snapshot(source):
+            return
+        retry_after = SNAPSHOT_RETRY_AFTER_SECONDS
+        breaker = self.breakers.get(source)
+        if breaker is not None:
+            retry_after = max(retry_after, math.ceil(breaker.retry_in()))
+        raise SnapshotUnavailableError(source, retry_after)
+    
+    def take_stale_sources(self) -> Set[str]:
+        """Fontes vencidas consultadas nesta thread desde a última chamada"""
+        consulted = getattr(self._request_state, 'stale', None)
+        self._request_state.stale = None
+        return consulted or set()
+    
+    def get_source_status(self) -> Dict[str, Dict[str, Any]]:
+        """Situação de cada fonte: snapshot vencido e estado do circuito"""
+        stale = {
+            'onionoo': self.cache_service.needs_detailed_cache_update,
+            'exit_addresses': self.cache_service.needs_exit_cache_update,
+        }
+        return {
+            source: {
+                'stale': stale[source]() if source in stale else None,
+                'circuit': breaker.to_dict()
+            }
+            for source, breaker in self.breakers.items()
+        }
+    
+    def refresh_exit_nodes(self) -> bool:
+        """Atualiza o cache de exit nodes se expirado; retorna ``True`` se buscou upstream"""
+        return self._refresh_source(
+            'exit_addresses',
+            self.cache_service.needs_exit_cache_update,
+            self.fetch_exit_nodes
+        )
+    
+    def refresh_detailed_nodes(self) -> bool:
+        """Atualiza o cache detalhado se expirado; retorna ``True`` se buscou upstream"""
+        def needs_update() -> bool:
+            # Adota primeiro o snapshot publicado por outro worker, se houver
+            self.cache_service.sync_detailed_cache()
+            return self.cache_service.needs_detailed_cache_update()
+        
+        return self._refresh_source('onionoo', needs_update, self.fetch_detailed_nodes)
+    
+    def _conditional_get(
+        self,
+        source: str,
+        validators: Dict[str, str]
+    ) -> Tuple[Optional[requests.Response], Dict[str, str]]:
+        """Busca a fonte com If-None-Match/If-Modified-Since, sem ler o corpo.
+        
+        Retorna ``(None, validators)`` quando a origem responde 304; caso
+        contrário retorna a resposta em modo streaming e os novos validadores
+        (o ``sha256`` é preenchido por ``_iter_body`` ao fim da leitura).
+        """
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        
+        response = self.sessions[source].get(
+            self.sources[source],
+            headers=headers,
+            timeout=self._source_timeout(source),
+            stream=True
+        )
+        if response.status_code == 304:
+            response.close()
+            logging.info(f"Fonte '{source}' não modificada (304)")
+            return None, validators
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        
+        new_validators = {
+            'etag': response.headers.get('ETag', ''),
+            'last_modified': response.headers.get('Last-Modified', ''),
+            'sha256': ''
+        }
+        return response, new_validators
+    
+    @staticmethod
+    def _iter_body(
+        response: requests.Response,
+        validators: Dict[str, str],
+        timings: Dict[str, float]
+    ) -> Iterator[bytes]:
+        """Lê o corpo em blocos, calculando o sha256 incrementalmente.
+        
+        Acumula em ``timings['download']`` o tempo gasto esperando cada bloco.
+        """
+        digest = hashlib.sha256()
+        chunks = response.iter_content(chunk_size=UPSTREAM_CHUNK_SIZE)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            timings['download'] += time.perf_counter() - start
+            if chunk is None:
+                break
+            digest.update(chunk)
+            yield chunk
+        validators['sha256'] = digest.hexdigest()
     
     def fetch_exit_nodes(self) -> List[str]:
         """Busca lista de IPs dos nós exit"""
+        source = 'exit_addresses'
+        result = 'error'
+        start = time.perf_counter()
         try:
             logging.info("Buscando dados dos nós exit...")
             
-            response = self.session.get(
-                self.sources['exit_addresses'],
-                timeout=self.request_timeout
-            )
-            response.raise_for_status()
+            old_validators = self.cache_service.load_exit_validators()
+            response, validators = self._conditional_get(source, old_validators)
+            if response is None:
+                result = 'not_modified'
+                self.cache_service.touch_exit_cache()
+                return self.cache_service.load_exit_cache()
             
-            ips = []
-            ips_with_timestamp = []
+            timings = {'download': 0.0}
+            read_start = time.perf_counter()
+            with response:
+                body = self._iter_body(response, validators, timings)
+                entries = list(iter_exit_addresses(body))
+            self._observe_transfer(source, time.perf_counter() - read_start, timings)
             
-            for line in response.text.splitlines():
-                if line.startswith('ExitAddress'):
-                    parts = line.split()
-                    if len(parts) >= 3:
-                        ip = parts[1]
-                        timestamp = ' '.join(parts[2:])
-                        ips.append(ip)
-                        ips_with_timestamp.append(f"{ip} # Last seen: {timestamp}")
+            if validators['sha256'] == old_validators.get('sha256'):
+                result = 'unchanged'
+                logging.info("Fonte 'exit_addresses' com conteúdo idêntico; cache mantido")
+                self.cache_service.touch_exit_cache()
+                return self.cache_service.load_exit_cache()
             
-            self.cache_service.save_exit_cache(ips, ips_with_timestamp)
-            logging.info(f"Dados dos nós exit atualizados: {len(ips)} IPs")
+            with REFRESH_DURATION.time(source, 'save'):
+                self.cache_service.save_exit_cache(entries, validators)
+            result = 'updated'
+            logging.info(f"Dados dos nós exit atualizados: {len(entries)} IPs")
             
-            return ips
+            return [ip for ip, _ in entries]
             
         except requests.RequestException as e:
             logging.error(f"Erro ao buscar nós exit: {e}")
@@ -143,30 +448,53 @@ class TorService:
         except Exception as e:
             logging.error(f"Erro inesperado ao buscar nós exit: {e}")
             raise
+        finally:
+            REFRESH_DURATION.observe(time.perf_counter() - start, source, 'fetch')
+            UPSTREAM_FETCHES.inc(source, self._fetch_trigger(), result)
     
-    def fetch_detailed_nodes(self) -> List[Dict[str, Any]]:
-        """Busca dados detalhados dos nós Tor"""
+    def fetch_detailed_nodes(self) -> RelayStore:
+        """Busca dados detalhados dos nós Tor.
+        
+        O documento do Onionoo é decodificado relay a relay direto no store
+        colunar, sem materializar o JSON inteiro em memória.
+        """
+        source = 'onionoo'
+        result = 'error'
+        start = time.perf_counter()
         try:
             logging.info("Buscando dados detalhados dos nós Tor...")
             
-            response = self.session.get(
-                self.sources['onionoo'],
-                timeout=self.request_timeout
-            )
-            response.raise_for_status()
+            old_validators = self.cache_service.detailed_cache['validators']
+            response, validators = self._conditional_get(source, old_validators)
+            if response is None:
+                result = 'not_modified'
+                self.cache_service.touch_detailed_cache()
+                return self.cache_service.detailed_cache['store']
             
-            data = response.json()
-            nodes = []
+            store = RelayStore()
+            timings = {'download': 0.0}
+            read_start = time.perf_counter()
+            with response:
+                body = self._iter_body(response, validators, timings)
+                for relay in iter_onionoo_relays(body):
+                    store.append(TorNodeData(relay))
+                # Consome o restante do documento para fechar o hash
+                for _ in body:
+                    pass
+            self._observe_transfer(source, time.perf_counter() - read_start, timings)
             
-            if 'relays' in data:
-                for relay in data['relays']:
-                    node = TorNodeData(relay)
-                    nodes.append(node.to_dict())
+            if validators['sha256'] == old_validators.get('sha256'):
+                result = 'unchanged'
+                logging.info("Fonte 'onionoo' com conteúdo idêntico; snapshot mantido")
+                self.cache_service.touch_detailed_cache()
+                return self.cache_service.detailed_cache['store']
             
-            self.cache_service.save_detailed_cache(nodes)
-            logging.info(f"Dados detalhados atualizados: {len(nodes)} nós")
+            with REFRESH_DURATION.time(source, 'save'):
+                self.cache_service.save_detailed_cache(store, validators)
+            result = 'updated'
+            logging.info(f"Dados detalhados atualizados: {len(store)} nós")
             
-            return nodes
+            return store
             
         except requests.RequestException as e:
             logging.error(f"Erro ao buscar dados detalhados: {e}")
@@ -174,89 +502,94 @@ class TorService:
         except Exception as e:
             logging.error(f"Erro inesperado ao buscar dados detalhados: {e}")
             raise
+        finally:
+            REFRESH_DURATION.observe(time.perf_counter() - start, source, 'fetch')
+            UPSTREAM_FETCHES.inc(source, self._fetch_trigger(), result)
     
-    def get_exit_nodes(self) -> List[str]:
-        """Retorna lista de IPs dos nós exit"""
-        if self.cache_service.needs_exit_cache_update():
-            return self.fetch_exit_nodes()
-        return self.cache_service.load_exit_cache()
-    
-    def get_detailed_nodes(self) -> List[Dict[str, Any]]:
-        """Retorna dados detalhados dos nós"""
-        if self.cache_service.needs_detailed_cache_update():
-            return self.fetch_detailed_nodes()
-        return self.cache_service.load_detailed_cache()
-    
-    def get_running_nodes(self) -> List[Dict[str, Any]]:
-        """Retorna apenas nós ativos"""
-        nodes = self.get_detailed_nodes()
-        return [node for node in nodes if node.get('running', False)]
-    
-    def get_exit_nodes_detailed(self) -> List[Dict[str, Any]]:
-        """Retorna apenas nós exit com dados detalhados"""
-        nodes = self.get_detailed_nodes()
-        return [node for node in nodes if node.get('exit_node', False)]
-    
-    def get_nodes_by_country(self, country_code: str) -> List[Dict[str, Any]]:
-        """Retorna nós de um país específico"""
-        nodes = self.get_detailed_nodes()
-        return [
-            node for node in nodes 
-            if node.get('country', '').upper() == country_code.upper()
-        ]
+    def get_exit_diff(self, since: Optional[int]) -> Dict[str, Any]:
+        """Mudanças na lista de exits desde ``since``, ou a lista completa"""
+        self.revalidate('exit_addresses')
+        self.require_snapshot('exit_addresses')
+        return self.cache_service.get_exit_diff(since)
     
-    def get_statistics(self) -> Dict[str, Any]:
-        """Retorna estatísticas dos nós"""
-        nodes = self.get_detailed_nodes()
-        
-        total_nodes = len(nodes)
-        running_nodes = len([n for n in nodes if n.get('running', False)])
-        exit_nodes = len([n for n in nodes if n.get('exit_node', False)])
+    def lookup_exit_ip(self, ip: str) -> Tuple[bool, Optional[datetime]]:
+        """Indica se o IP é um nó exit e quando foi visto pela última vez"""
+        self.revalidate('exit_addresses')
+        self.require_snapshot('exit_addresses')
+        return self.cache_service.get_exit_lookup().get(ip)
+    
+    def enrich_ips(self, ips: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Enriquece IPs com status de exit e dados do relay (Onionoo), um a um.
         
-        countries = {}
-        total_bandwidth = 0
-        flags_count = {}
+        Usa o snapshot vigente no início da iteração para todo o lote, e
+        consome ``ips`` de forma incremental (memória constante). Quem chama
+        garante (``require_snapshot``) que as duas fontes já têm snapshot.
+        """
+        self.revalidate('exit_addresses')
+        self.revalidate('onionoo')
+        lookup = self.cache_service.get_exit_lookup()
+        index = self.cache_service.detailed_index
+        store = index.store
         
-        for node in nodes:
-            # Contagem por país
-            country = node.get('country', 'Unknown')
-            countries[country] = countries.get(country, 0) + 1
+        for raw in ips:
+            ip = normalize_ip_address(raw)
+            if ip is None:
+                yield {'ip': raw, 'error': 'invalid_ip'}
+                continue
+            
+            is_exit, last_seen = lookup.get(ip)
+            result: Dict[str, Any] = {
+                'ip': ip,
+                'is_tor_exit': is_exit,
+                'last_seen': last_seen.isoformat() if last_seen else None,
+                'is_relay': False,
+                'fingerprint': None,
+                'nickname': None,
+                'country': None,
+                'as_name': None
+            }
             
-            # Bandwidth total
-            total_bandwidth += node.get('bandwidth', 0)
+            row = index.address(ip)
+            if row is not None:
+                result['is_relay'] = True
+                result['fingerprint'] = store.strings[store.fingerprint[row]]
+                result['nickname'] = store.strings[store.nickname[row]]
+                result['country'] = store.countries[store.country[row]]
+                result['as_name'] = store.as_names[store.as_name[row]]
             
-            # Contagem de flags
-            for flag in node.get('flags', []):
-                flags_count[flag] = flags_count.get(flag, 0) + 1
+            yield result
+    
+    def get_detailed_nodes(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Retorna dados detalhados dos nós (opcionalmente só os ``limit`` primeiros)"""
+        self.revalidate('onionoo')
+        return self.cache_service.load_detailed_cache(limit)
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        """Retorna estatísticas dos nós (pré-calculadas na instalação do snapshot)"""
+        self.revalidate('onionoo')
+        last_updated = self.cache_service.detailed_cache['last_updated']
         
-        return {
-            'total_nodes': total_nodes,
-            'running_nodes': running_nodes,
-            'offline_nodes': total_nodes - running_nodes,
-            'exit_nodes': exit_nodes,
-            'total_bandwidth': total_bandwidth,
-            'countries_count': len(countries),
-            'top_countries': sorted(
-                countries.items(), 
-                key=lambda x: x[1], 
-                reverse=True
-            )[:10],
-            'flags_distribution': flags_count,
-            'last_updated': self.cache_service.detailed_cache['last_updated'].isoformat() 
-            if self.cache_service.detailed_cache['last_updated'] else None
-        }
+        statistics = self.cache_service.detailed_stats.to_dict()
+        statistics['last_updated'] = last_updated.isoformat() if last_updated else None
+        return statistics
     
-    def initialize_cache(self) -> None:
-        """Inicializa os caches se necessário"""
-        try:
-            if self.cache_service.needs_exit_cache_update():
-                logging.info("Inicializando cache de exit nodes...")
-                self.fetch_exit_nodes()
-            
-            if self.cache_service.needs_detailed_cache_update():
-                logging.info("Inicializando cache detalhado...")
-                self.fetch_detailed_nodes()
-                
-        except Exception as e:
-            logging.error(f"Erro ao inicializar cache: {e}")
-            raise
+    def load_snapshots(self) -> None:
+        """Carrega os snapshots persistidos em ``CACHE_DIR``, sem acessar a rede.
+        
+        O que faltar ou estiver vencido é buscado pelo agendador em
+        background; até lá, as rotas servem o que houver.
+        """
+        self.cache_service.sync_detailed_cache()
+        caches = {
+            'exit_addresses': self.cache_service.get_exit_cache_info(),
+            'onionoo': self.cache_service.get_detailed_cache_info(),
+        }
+        for source, info in caches.items():
+            if not info.exists:
+                logging.info(f"Sem snapshot persistido de '{source}'; será buscado em background")
+                continue
+            state = 'vencido' if info.needs_update else 'válido'
+            logging.info(
+                f"Snapshot de '{source}' carregado: {info.item_count} itens, "
+                f"atualizado em {info.last_update.isoformat() if info.last_update else '?'} ({state})"
+            )
@@ -7,19 +7,42 @@ no log do servidor, nunca na resposta HTTP.
 """
 
 import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import List, Optional, Tuple
-from urllib.parse import urlparse
 
 import pymysql
 
 from config.settings import Config
+from services.connection_pool import ConnectionPool
+from utils.compression import EncodedBody
+from utils.domains import DomainAllowlist, normalize_host
+from utils.formatters import format_url_list_text
+from utils.metrics import CACHE_REQUESTS, HONEYPOT_SYNC_DURATION
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class UrlFeed:
+    """Resultado de uma consulta ao honeypot, já formatado para o feed."""
+    urls: Tuple[str, ...]
+    last_update: Optional[datetime]
+    body: EncodedBody
+    expires_at: float
+
+
 class UrlService:
-    """Serviço para consulta de URLs maliciosas recentes."""
+    """Serviço para consulta de URLs maliciosas recentes.
+
+    As consultas passam por um pool limitado de conexões e o resultado
+    (inclusive o texto do feed) fica em memória por
+    ``HONEYPOT_CACHE_TTL_SECONDS``, compartilhado por todas as requisições
+    do worker.
+    """
 
     CONNECT_TIMEOUT_SECONDS = 5
 
@@ -34,7 +57,21 @@ class UrlService:
             'connect_timeout': self.CONNECT_TIMEOUT_SECONDS,
             'read_timeout': self.CONNECT_TIMEOUT_SECONDS,
         }
-        self.legit_domains = {d.lower() for d in Config.LEGIT_DOMAINS}
+        if Config.LEGIT_DOMAINS_FILE:
+            self.legit_domains = DomainAllowlist.from_file(Config.LEGIT_DOMAINS_FILE, Config.LEGIT_DOMAINS)
+        else:
+            self.legit_domains = DomainAllowlist(Config.LEGIT_DOMAINS)
+        self.cache_ttl = Config.HONEYPOT_CACHE_TTL_SECONDS
+        self.pool = ConnectionPool(self.db_config, max_size=Config.DB_POOL_SIZE)
+        self.window = timedelta(days=30)
+        self.full_sync_interval = Config.HONEYPOT_FULL_SYNC_MINUTES * 60
+        self._feed: Optional[UrlFeed] = None
+        self._refresh_lock = threading.Lock()
+
+        # URLs da janela em ordem crescente de last_view (url -> last_view)
+        self._entries: 'OrderedDict[str, datetime]' = OrderedDict()
+        self._watermark: Optional[datetime] = None
+        self._last_full_sync: Optional[float] = None
 
     def is_configured(self) -> bool:
         """Indica se há configuração mínima de banco para consultar o honeypot."""
@@ -47,40 +84,122 @@ class UrlService:
         configurado ou acessível, retorna ``([], None)`` e registra o motivo
         no log do servidor.
         """
-        if not self.is_configured():
-            logger.info("Honeypot DB não configurado; retornando lista vazia.")
-            return [], None
+        feed = self.get_feed()
+        return list(feed.urls), feed.last_update
 
-        cutoff = datetime.utcnow() - timedelta(days=30)
-        query = "SELECT url, last_view FROM urls WHERE last_view >= %s"
+    def get_feed(self) -> UrlFeed:
+        """Retorna o feed em cache, consultando o banco só quando o TTL expira.
 
+        Uma única requisição por vez refaz a consulta; as demais continuam
+        servindo o resultado anterior enquanto ele existir. Em caso de falha
+        do banco, o último resultado válido continua sendo servido.
+        """
+        feed = self._feed
+        if feed is not None and time.monotonic() < feed.expires_at:
+            CACHE_REQUESTS.inc('honeypot', 'hit')
+            return feed
+
+        if not self._refresh_lock.acquire(blocking=feed is None):
+            CACHE_REQUESTS.inc('honeypot', 'stale')
+            return feed
         try:
-            connection = pymysql.connect(**self.db_config)
-        except pymysql.MySQLError as exc:
-            logger.warning("Honeypot DB indisponível; retornando lista vazia. Detalhe: %s", exc)
+            feed = self._feed
+            if feed is not None and time.monotonic() < feed.expires_at:
+                CACHE_REQUESTS.inc('honeypot', 'hit')
+                return feed
+
+            CACHE_REQUESTS.inc('honeypot', 'miss')
+            result = self._query_recent_urls()
+            if result is None and feed is not None:
+                urls, last_update = feed.urls, feed.last_update
+            else:
+                urls, last_update = result or ([], None)
+
+            self._feed = UrlFeed(
+                urls=tuple(urls),
+                last_update=last_update,
+                body=EncodedBody(
+                    format_url_list_text(list(urls), last_update).encode('utf-8'),
+                    'text/plain',
+                    precompress=False
+                ),
+                expires_at=time.monotonic() + self.cache_ttl,
+            )
+            return self._feed
+        finally:
+            self._refresh_lock.release()
+
+    def _query_recent_urls(self) -> Optional[Tuple[List[str], Optional[datetime]]]:
+        """Sincroniza com o banco; retorna ``None`` se ele estiver indisponível.
+
+        Após a primeira carga, busca apenas linhas com ``last_view`` a partir
+        da marca d'água (maior ``last_view`` já visto) e descarta as que saíram
+        da janela de 30 dias. Uma carga completa é refeita a cada
+        ``HONEYPOT_FULL_SYNC_MINUTES`` para refletir linhas removidas.
+        """
+        if not self.is_configured():
+            logger.info("Honeypot DB não configurado; retornando lista vazia.")
             return [], None
 
+        cutoff = datetime.utcnow() - self.window
+        full = (
+            self._watermark is None
+            or self._last_full_sync is None
+            or time.monotonic() - self._last_full_sync >= self.full_sync_interval
+        )
+        since = cutoff if full else max(self._watermark, cutoff)
+        # >= para não perder linhas gravadas no mesmo segundo da marca d'água
+        query = "SELECT url, last_view FROM urls WHERE last_view >= %s ORDER BY last_view"
+
+        mode = 'full' if full else 'incremental'
+        start = time.perf_counter()
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(query, (cutoff,))
-                rows = cursor.fetchall()
+            with self.pool.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(query, (since,))
+                    rows = cursor.fetchall()
         except pymysql.MySQLError as exc:
-            logger.warning("Falha ao consultar honeypot DB; retornando lista vazia. Detalhe: %s", exc)
-            return [], None
-        finally:
-            connection.close()
-
-        urls: List[str] = []
-        last_update: Optional[datetime] = None
+            HONEYPOT_SYNC_DURATION.observe(time.perf_counter() - start, 'error')
+            logger.warning("Honeypot DB indisponível; mantendo o último resultado. Detalhe: %s", exc)
+            return None
+        HONEYPOT_SYNC_DURATION.observe(time.perf_counter() - start, mode)
+
+        if full:
+            self._entries = OrderedDict()
+            self._watermark = None
+            self._last_full_sync = time.monotonic()
+        self._apply_rows(rows)
+        self._expire(cutoff)
+
+        logger.debug(
+            "Honeypot sincronizado (%s): %d linhas novas, %d URLs na janela",
+            'completo' if full else 'incremental', len(rows), len(self._entries)
+        )
+        return list(self._entries), self._watermark
+
+    def _apply_rows(self, rows: List[dict]) -> None:
+        """Incorpora linhas ordenadas por ``last_view``, mantendo a ordem das entradas."""
+        entries = self._entries
         for row in rows:
             url = row.get('url')
             last_view = row.get('last_view')
-            if last_view and (last_update is None or last_view > last_update):
-                last_update = last_view
+            if not last_view:
+                continue
+            if self._watermark is None or last_view > self._watermark:
+                self._watermark = last_view
             if not url:
                 continue
-            domain = urlparse(url).netloc.lower()
-            if domain and domain not in self.legit_domains:
-                urls.append(url)
-
-        return urls, last_update
+            host = normalize_host(url)
+            if host and host not in self.legit_domains:
+                # Reinsere no fim: last_view nova é >= a todas as já guardadas
+                entries.pop(url, None)
+                entries[url] = last_view
+
+    def _expire(self, cutoff: datetime) -> None:
+        """Remove do início as URLs sem atividade desde ``cutoff``."""
+        entries = self._entries
+        while entries:
+            url, last_view = next(iter(entries.items()))
+            if last_view >= cutoff:
+                break
+            entries.popitem(last=False)
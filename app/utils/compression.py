@@ -0,0 +1,191 @@
+"""
+Corpos de resposta pré-serializados e pré-comprimidos
+"""
+
+import gzip
+import struct
+import zlib
+from typing import Dict, List, Optional
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # Brotli é opcional; sem ele servimos gzip/identity
+    brotli = None
+
+# Ordem de preferência quando o cliente aceita mais de uma codificação
+ENCODING_PREFERENCE = ('br', 'gzip', 'identity')
+
+# Cabeçalho gzip fixo (mtime=0, nível máximo), o mesmo de ``gzip.compress``
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x02\xff'
+# Maior meta-bloco brotli não comprimido com MNIBBLES=4 (MLEN em 16 bits)
+BROTLI_RAW_BLOCK = 1 << 16
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Converte o cabeçalho Accept-Encoding em um mapa codificação -> q"""
+    accepted: Dict[str, float] = {}
+    if not header:
+        return accepted
+
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+
+    return accepted
+
+
+def negotiate_encoding(header: Optional[str], available: tuple) -> str:
+    """Escolhe a melhor codificação disponível aceita pelo cliente"""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*')
+
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in available:
+            continue
+        quality = accepted.get(encoding, wildcard)
+        if encoding == 'identity' and quality is None:
+            return encoding
+        if quality:
+            return encoding
+
+    return 'identity'
+
+
+class EncodedBody:
+    """Corpo renderizado uma única vez, com variantes gzip e brotli prontas.
+
+    Com ``precompress=False`` cada variante é comprimida apenas na primeira
+    requisição que a negociar (útil para corpos que podem nunca ser pedidos
+    comprimidos, como resultados de consultas em cache).
+    """
+
+    __slots__ = ('body', 'mimetype', 'variants')
+
+    ENCODINGS = ('identity', 'gzip', 'br') if brotli is not None else ('identity', 'gzip')
+
+    def __init__(self, body: bytes, mimetype: str, precompress: bool = True):
+        self.body = body
+        self.mimetype = mimetype
+        self.variants: Dict[str, bytes] = {'identity': body}
+        if precompress:
+            for encoding in self.ENCODINGS:
+                self.variant(encoding)
+
+    def variant(self, encoding: str) -> bytes:
+        """Corpo na codificação pedida, comprimindo sob demanda"""
+        data = self.variants.get(encoding)
+        if data is None:
+            if encoding == 'gzip':
+                data = gzip.compress(self.body, compresslevel=9, mtime=0)
+            elif encoding == 'br':
+                data = brotli.compress(self.body, quality=9)
+            else:
+                raise ValueError(f"Codificação não suportada: {encoding}")
+            self.variants[encoding] = data
+        return data
+
+    def to_response(self, accept_encoding: Optional[str], status: int = 200) -> Response:
+        """Monta a resposta com a variante negociada via Accept-Encoding"""
+        encoding = negotiate_encoding(accept_encoding, self.ENCODINGS)
+        response = Response(self.variant(encoding), status=status, mimetype=self.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def _brotli_raw_tail(data: bytes) -> bytes:
+    """Meta-blocos brotli não comprimidos com ``data`` + meta-bloco final vazio.
+
+    Cabeçalho de cada bloco (bits do menos significativo): ISLAST=0,
+    MNIBBLES=4, MLEN-1 em 16 bits, ISUNCOMPRESSED=1 e zeros até o byte.
+    """
+    parts = []
+    for start in range(0, len(data), BROTLI_RAW_BLOCK):
+        block = data[start:start + BROTLI_RAW_BLOCK]
+        header = ((len(block) - 1) << 3) | (1 << 19)
+        parts.append(header.to_bytes(3, 'little'))
+        parts.append(block)
+    # ISLAST=1, ISLASTEMPTY=1
+    parts.append(b'\x03')
+    return b''.join(parts)
+
+
+class EncodedPrefix:
+    """Início de um corpo, comprimido uma única vez, completado por um sufixo curto.
+
+    As variantes gzip e brotli param num flush alinhado em byte, sem bloco
+    final. ``complete`` anexa o sufixo (ex.: um ``last_updated`` que muda a
+    cada revalidação) sem recomprimir o prefixo: no gzip, novos blocos
+    deflate e o trailer com o CRC continuado; no brotli, meta-blocos não
+    comprimidos e o meta-bloco final.
+    """
+
+    __slots__ = ('body', 'mimetype', 'variants', '_crc')
+
+    def __init__(self, body: bytes, mimetype: str, variants: Optional[Dict[str, bytes]] = None):
+        self.body = body
+        self.mimetype = mimetype
+        if variants is None:
+            deflate = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+            variants = {
+                'identity': body,
+                'gzip': GZIP_HEADER + deflate.compress(body) + deflate.flush(zlib.Z_SYNC_FLUSH)
+            }
+            if brotli is not None:
+                compressor = brotli.Compressor(quality=9)
+                variants['br'] = compressor.process(body) + compressor.flush()
+        self.variants = variants
+        self._crc = zlib.crc32(body)
+
+    def complete(self, suffix: bytes) -> 'SplicedBody':
+        """Corpo completo ``prefixo + suffix`` em todas as variantes do prefixo"""
+        deflate = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        size = (len(self.body) + len(suffix)) & 0xffffffff
+        tails = {
+            'identity': suffix,
+            'gzip': deflate.compress(suffix) + deflate.flush()
+                    + struct.pack('<II', zlib.crc32(suffix, self._crc), size)
+        }
+        if 'br' in self.variants:
+            tails['br'] = _brotli_raw_tail(suffix)
+        return SplicedBody(self, tails)
+
+
+class SplicedBody:
+    """Prefixo pré-comprimido + sufixo, enviados em dois blocos (sem concatenar o corpo)"""
+
+    __slots__ = ('prefix', 'tails')
+
+    def __init__(self, prefix: EncodedPrefix, tails: Dict[str, bytes]):
+        self.prefix = prefix
+        self.tails = tails
+
+    @property
+    def body(self) -> bytes:
+        """Corpo sem compressão, concatenado (cópia: não usar no caminho da resposta)"""
+        return self.prefix.body + self.tails['identity']
+
+    def chunks(self, encoding: str) -> List[bytes]:
+        return [self.prefix.variants[encoding], self.tails[encoding]]
+
+    def to_response(self, accept_encoding: Optional[str], status: int = 200) -> Response:
+        """Monta a resposta com a variante negociada via Accept-Encoding"""
+        encoding = negotiate_encoding(accept_encoding, tuple(self.tails))
+        response = Response(self.chunks(encoding), status=status, mimetype=self.prefix.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
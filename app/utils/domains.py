@@ -0,0 +1,80 @@
+"""
+Normalização de hosts e allowlist de domínios por sufixo
+"""
+
+import ipaddress
+import logging
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+
+def normalize_host(url: str) -> Optional[str]:
+    """Extrai o host de uma URL, sem userinfo, porta e ponto final, em minúsculas"""
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    return host.rstrip('.') or None
+
+
+def normalize_domain(entry: str) -> Optional[str]:
+    """Normaliza uma entrada da allowlist (aceita ``*.dominio`` e linhas ``rank,dominio``)"""
+    entry = entry.strip().lower()
+    if not entry or entry.startswith('#'):
+        return None
+    entry = entry.rsplit(',', 1)[-1].strip()
+    if entry.startswith('*.'):
+        entry = entry[2:]
+    return entry.strip('.') or None
+
+
+class DomainAllowlist:
+    """Conjunto de domínios em que cada entrada cobre também seus subdomínios.
+
+    A consulta testa o host e cada um de seus sufixos de rótulo num único
+    conjunto hash: O(rótulos) por URL, independente do tamanho da lista.
+    IPs só casam com entradas idênticas.
+    """
+
+    def __init__(self, domains: Iterable[str] = ()):
+        self._domains = set()
+        for domain in domains:
+            self.add(domain)
+
+    @classmethod
+    def from_file(cls, path: str, domains: Iterable[str] = ()) -> 'DomainAllowlist':
+        """Carrega um domínio por linha (ex.: lista Tranco ``rank,dominio``)"""
+        allowlist = cls(domains)
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                allowlist.add(line)
+        logging.info(f"Allowlist de domínios carregada: {len(allowlist)} entradas")
+        return allowlist
+
+    def add(self, entry: str) -> None:
+        domain = normalize_domain(entry)
+        if domain:
+            self._domains.add(domain)
+
+    def __len__(self) -> int:
+        return len(self._domains)
+
+    def __contains__(self, host: str) -> bool:
+        domains = self._domains
+        if host in domains:
+            return True
+        if host[-1:].isdigit() or ':' in host:
+            try:
+                ipaddress.ip_address(host)
+                return False
+            except ValueError:
+                pass
+
+        pos = host.find('.')
+        while pos != -1:
+            if host[pos + 1:] in domains:
+                return True
+            pos = host.find('.', pos + 1)
+        return False
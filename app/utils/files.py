@@ -0,0 +1,45 @@
+"""
+Escrita atômica de arquivos compartilhados entre workers
+"""
+
+import os
+from typing import Callable, Optional
+
+
+def atomic_write(
+    path: str,
+    data: bytes,
+    mtime: Optional[int] = None,
+    before_replace: Optional[Callable[[str], None]] = None
+) -> None:
+    """Escreve via temporário + fsync + rename: leitores veem o arquivo antigo
+    ou o novo por inteiro, mesmo após uma queda no meio da escrita.
+
+    ``mtime`` fixa o horário de modificação do arquivo publicado.
+    ``before_replace`` recebe o caminho do temporário já completo e roda
+    antes de o arquivo ficar visível para os demais processos.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            if mtime is not None:
+                os.utime(tmp_path, (mtime, mtime))
+            os.fsync(f.fileno())
+        if before_replace is not None:
+            before_replace(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Persiste a entrada de diretório do rename
+    dir_fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
@@ -0,0 +1,399 @@
+"""
+Métricas no formato de exposição do Prometheus, agregadas entre workers
+"""
+
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Limites (segundos) dos buckets de latência
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[str, ...]
+
+# Totais dos workers que já terminaram, somados pelo processo mestre
+EXITED_FILE = 'metrics_exited.json'
+# Ids de arquivos já somados ao agregado, guardados para evitar contagem dupla
+FOLDED_IDS_KEPT = 64
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, labelnames: Sequence[str]):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, object] = {}
+
+
+class Counter(_Metric):
+    """Contador monotônico; a soma entre workers inclui os que já terminaram"""
+
+    kind = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.registry.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self, values: Dict[Labels, object]) -> Iterator[str]:
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+    @staticmethod
+    def merge(current: object, other: object) -> object:
+        return current + other
+
+
+class Histogram(_Metric):
+    """Histograma de durações; cada série guarda contagens por bucket e a soma"""
+
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(*args)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str) -> None:
+        # Contagens não cumulativas (a última posição é +Inf) seguidas da soma
+        position = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[position] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observa a duração do bloco, inclusive quando ele levanta exceção"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self, values: Dict[Labels, object]) -> Iterator[str]:
+        bounds = [_format_value(bound) for bound in self.buckets] + ['+Inf']
+        for labels, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+    @staticmethod
+    def merge(current: object, other: object) -> object:
+        if len(current) != len(other):
+            return current
+        return [a + b for a, b in zip(current, other)]
+
+
+class Gauge(_Metric):
+    """Valor instantâneo calculado no momento da coleta, só no processo que responde"""
+
+    kind = 'gauge'
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.callback: Optional[Callable[[], Dict[Labels, float]]] = None
+
+    def set_function(self, callback: Callable[[], Dict[Labels, float]]) -> None:
+        self.callback = callback
+
+    def collect(self) -> Dict[Labels, float]:
+        if self.callback is None:
+            return {}
+        try:
+            return self.callback()
+        except Exception as e:
+            logging.debug(f"Gauge '{self.name}' indisponível: {e}")
+            return {}
+
+    def render(self, values: Dict[Labels, object]) -> Iterator[str]:
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    """Registro de métricas do processo, exportado por arquivo para os demais workers.
+
+    Cada worker grava seus contadores e histogramas em ``metrics_<pid>.json``
+    no diretório configurado, a cada ``flush_interval`` segundos (numa thread
+    própria, fora do caminho das requisições). Quem responde ``/metrics``
+    soma os próprios valores, lidos da memória, aos arquivos dos outros.
+    Registrar um valor custa só um lock sem disputa e uma soma em dict.
+
+    Quando um worker termina, o mestre soma o arquivo dele ao agregado
+    ``metrics_exited.json`` (``retire``); ao subir, limpa o diretório
+    (``clear``). Assim os contadores não somam execuções anteriores nem
+    andam para trás quando um PID é reaproveitado.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._directory: Optional[str] = None
+        self._flush_interval = 5.0
+        self._flusher: Optional[threading.Thread] = None
+        # Identifica o arquivo deste processo no agregado dos que terminaram
+        self._file_id = uuid.uuid4().hex
+
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(self, name, help_text, labelnames, buckets=buckets))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, help_text, labelnames))
+
+    def configure(self, directory: str, flush_interval: float = 5.0) -> None:
+        """Define onde os workers trocam seus valores.
+
+        A thread de gravação só nasce em ``start_flusher``, chamado a partir
+        das requisições: assim ela existe apenas nos workers (após o fork).
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._flush_interval = flush_interval
+
+    def start_flusher(self) -> None:
+        """Inicia a thread de gravação deste processo, se ainda não houver uma"""
+        if self._directory is None or self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True)
+        self._flusher.start()
+
+    def _after_fork(self) -> None:
+        # Valores herdados pertencem ao processo pai; a thread não sobrevive ao fork
+        self.lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric.values = {}
+        self._flusher = None
+        self._file_id = uuid.uuid4().hex
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self._directory, f"metrics_{pid}.json")
+
+    @staticmethod
+    def _read(path: str) -> Optional[dict]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return payload if isinstance(payload, dict) and 'metrics' in payload else None
+
+    @staticmethod
+    def _write(path: str, payload: dict) -> None:
+        """Grava via temporário + rename (sem fsync)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def _merge_into(self, collected: Dict[str, Dict[Labels, object]], metrics: Dict[str, list]) -> None:
+        for name, series in metrics.items():
+            metric = self._metrics.get(name)
+            if metric is None:
+                continue
+            values = collected.setdefault(name, {})
+            for labels, value in series:
+                labels = tuple(labels)
+                values[labels] = metric.merge(values[labels], value) if labels in values else value
+
+    def clear(self) -> None:
+        """Remove os arquivos de todos os processos (mestre, antes de criar os workers)"""
+        if self._directory is None:
+            return
+        for path in glob.glob(os.path.join(self._directory, 'metrics_*.json*')):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.warning(f"Falha ao remover métricas antigas {path}: {e}")
+
+    def retire(self, pid: int) -> None:
+        """Soma os valores de um worker que terminou ao agregado e remove o arquivo dele.
+
+        Chamado apenas pelo mestre (``child_exit``), um worker por vez.
+        """
+        if self._directory is None:
+            return
+        path = self._path(pid)
+        payload = self._read(path)
+        if payload is not None:
+            exited_path = os.path.join(self._directory, EXITED_FILE)
+            exited = self._read(exited_path) or {'metrics': {}, 'folded': []}
+            totals: Dict[str, Dict[Labels, object]] = {}
+            self._merge_into(totals, exited['metrics'])
+            self._merge_into(totals, payload['metrics'])
+            try:
+                self._write(exited_path, {
+                    'metrics': {
+                        name: [[list(labels), value] for labels, value in values.items()]
+                        for name, values in totals.items()
+                    },
+                    'folded': (exited.get('folded', []) + [payload.get('id')])[-FOLDED_IDS_KEPT:]
+                })
+            except OSError as e:
+                logging.warning(f"Falha ao agregar métricas do worker {pid}: {e}")
+                return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _dump(self) -> Dict[str, List[list]]:
+        with self.lock:
+            return {
+                # Copia as séries: histogramas seguem sendo alterados após o lock
+                name: [
+                    [list(labels), list(value) if isinstance(value, list) else value]
+                    for labels, value in metric.values.items()
+                ]
+                for name, metric in self._metrics.items()
+                if metric.kind != 'gauge' and metric.values
+            }
+
+    def flush(self) -> None:
+        """Grava os valores deste processo (temporário + rename, sem fsync)"""
+        if self._directory is None:
+            return
+        try:
+            self._write(self._path(os.getpid()), {'id': self._file_id, 'metrics': self._dump()})
+        except OSError as e:
+            logging.warning(f"Falha ao gravar métricas: {e}")
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self._flush_interval)
+            self.flush()
+
+    def _collect(self) -> Dict[str, Dict[Labels, object]]:
+        """Valores deste processo somados aos gravados pelos demais"""
+        collected = {
+            name: {tuple(labels): value for labels, value in series}
+            for name, series in self._dump().items()
+        }
+        if self._directory is None:
+            return collected
+
+        own = self._path(os.getpid())
+        exited_path = os.path.join(self._directory, EXITED_FILE)
+        workers = []
+        for path in glob.glob(os.path.join(self._directory, 'metrics_*.json')):
+            if path in (own, exited_path):
+                continue
+            payload = self._read(path)
+            if payload is not None:
+                workers.append(payload)
+
+        # O agregado é lido por último: um worker somado a ele entre as duas
+        # leituras é descartado pelo id, em vez de sumir ou contar duas vezes
+        exited = self._read(exited_path)
+        folded = set()
+        if exited is not None:
+            folded = set(exited.get('folded', []))
+            self._merge_into(collected, exited['metrics'])
+        for payload in workers:
+            if payload.get('id') not in folded:
+                self._merge_into(collected, payload['metrics'])
+        return collected
+
+    def render(self) -> str:
+        """Exposição em texto (``text/plain; version=0.0.4``)"""
+        collected = self._collect()
+        lines: List[str] = []
+        for name, metric in self._metrics.items():
+            values = metric.collect() if metric.kind == 'gauge' else collected.get(name, {})
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# Métricas compartilhadas pelos serviços
+REQUEST_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds',
+    'Duração das requisições HTTP por rota, método e status',
+    ('route', 'method', 'status')
+)
+REFRESH_DURATION = REGISTRY.histogram(
+    'tor_refresh_duration_seconds',
+    'Duração das etapas de atualização das fontes Tor (fetch, download, parse, save)',
+    ('source', 'stage')
+)
+UPSTREAM_FETCHES = REGISTRY.counter(
+    'tor_upstream_fetches_total',
+    'Buscas upstream por fonte, origem (request/background) e resultado',
+    ('source', 'trigger', 'result')
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    'cache_requests_total',
+    'Consultas aos caches em memória por resultado (hit/miss/stale)',
+    ('cache', 'result')
+)
+HONEYPOT_SYNC_DURATION = REGISTRY.histogram(
+    'honeypot_sync_duration_seconds',
+    'Duração da sincronização com o banco do honeypot por modo',
+    ('mode',)
+)
+STALE_RESPONSES = REGISTRY.counter(
+    'tor_stale_responses_total',
+    'Respostas servidas a partir de um snapshot vencido, por fonte',
+    ('source',)
+)
+CIRCUIT_OPEN = REGISTRY.gauge(
+    'tor_circuit_open',
+    'Circuito da fonte aberto (1) ou não (0) no processo que responde',
+    ('source',)
+)
+SNAPSHOT_AGE = REGISTRY.gauge(
+    'tor_snapshot_age_seconds',
+    'Idade do snapshot em uso por fonte',
+    ('source',)
+)
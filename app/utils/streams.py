@@ -0,0 +1,61 @@
+"""
+Leitura incremental de corpos de requisição
+"""
+
+import json
+from typing import IO, Iterator, Optional
+
+
+def iter_request_lines(
+    stream: IO[bytes],
+    max_line_length: int = 512,
+    chunk_size: int = 64 * 1024
+) -> Iterator[str]:
+    """Itera as linhas do corpo sem carregá-lo inteiro em memória.
+
+    Lê em blocos de ``chunk_size``; a memória fica limitada a um bloco mais
+    uma linha parcial. Linhas maiores que ``max_line_length`` são descartadas.
+    """
+    pending = b''
+    discarding = False
+
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if discarding:
+                discarding = False
+                continue
+            if len(line) > max_line_length:
+                continue
+            text = line.decode('utf-8', errors='replace').strip()
+            if text:
+                yield text
+
+        if len(pending) > max_line_length:
+            pending = b''
+            discarding = True
+
+    if pending and not discarding and len(pending) <= max_line_length:
+        text = pending.decode('utf-8', errors='replace').strip()
+        if text:
+            yield text
+
+
+def parse_ip_line(line: str) -> Optional[str]:
+    """Extrai o IP de uma linha em texto puro ou NDJSON (``{"ip": "..."}``)"""
+    if line.startswith('#'):
+        return None
+
+    if line.startswith('{'):
+        try:
+            value = json.loads(line).get('ip')
+        except (ValueError, AttributeError):
+            return line
+        return value if isinstance(value, str) else line
+
+    return line
@@ -2,8 +2,10 @@
 Funções de validação
 """
 
+import ipaddress
 import re
-from typing import Any
+import socket
+from typing import Any, Optional
 
 
 def validate_country_code(country_code: str) -> bool:
@@ -31,6 +33,25 @@ def validate_ip_address(ip: str) -> bool:
     return all(0 <= int(octet) <= 255 for octet in octets)
 
 
+def normalize_ip_address(ip: str) -> Optional[str]:
+    """Normaliza um endereço IPv4/IPv6; retorna ``None`` se inválido"""
+    if not isinstance(ip, str):
+        return None
+    
+    ip = ip.strip()
+    try:
+        # Caminho rápido: IPv4 em notação canônica (sem zeros à esquerda)
+        socket.inet_pton(socket.AF_INET, ip)
+        return ip
+    except OSError:
+        pass
+    
+    try:
+        return str(ipaddress.ip_address(ip))
+    except ValueError:
+        return None
+
+
 def sanitize_input(value: Any, max_length: int = 100) -> str:
     """Sanitiza entrada do usuário"""
     if not isinstance(value, str):
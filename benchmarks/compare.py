@@ -0,0 +1,68 @@
+"""
+Compara dois resultados de ``benchmarks/run.py`` rota a rota
+
+Uso::
+
+    python benchmarks/compare.py base.json novo.json
+"""
+
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _change(old: Optional[float], new: Optional[float]) -> str:
+    if not old or new is None:
+        return '—'
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def _peak_rss(result: Dict[str, Any]) -> Optional[int]:
+    peaks = [worker['rss_kb'].get('peak') for worker in result.get('workers', [])]
+    peaks = [peak for peak in peaks if peak is not None]
+    return max(peaks) if peaks else None
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    lines = [
+        f"base: {(base['meta'].get('commit') or '?')[:12]}  novo: {(new['meta'].get('commit') or '?')[:12]}",
+        '',
+        f"{'rota':<18} {'req/s':>10} {'Δ':>8} {'p50 ms':>9} {'Δ':>8} {'p99 ms':>9} {'Δ':>8}",
+    ]
+    base_routes = {route['name']: route for route in base.get('routes', [])}
+    for route in new.get('routes', []):
+        old = base_routes.get(route['name'])
+        if old is None:
+            continue
+        lines.append(
+            f"{route['name']:<18} {route['throughput_rps']:>10.1f} "
+            f"{_change(old['throughput_rps'], route['throughput_rps']):>8} "
+            f"{route['latency_ms']['p50']:>9.2f} {_change(old['latency_ms']['p50'], route['latency_ms']['p50']):>8} "
+            f"{route['latency_ms']['p99']:>9.2f} {_change(old['latency_ms']['p99'], route['latency_ms']['p99']):>8}"
+        )
+
+    base_rss, new_rss = _peak_rss(base), _peak_rss(new)
+    lines.append('')
+    lines.append(f"startup: {base.get('startup_seconds')}s -> {new.get('startup_seconds')}s "
+                 f"({_change(base.get('startup_seconds'), new.get('startup_seconds'))})")
+    lines.append(f"reinício aquecido: {base.get('warm_restart_seconds')}s -> {new.get('warm_restart_seconds')}s "
+                 f"({_change(base.get('warm_restart_seconds'), new.get('warm_restart_seconds'))})")
+    lines.append(f"RSS máximo por worker: {base_rss} kB -> {new_rss} kB ({_change(base_rss, new_rss)})")
+    return lines
+
+
+def main(argv: List[str]) -> int:
+    if len(argv) != 2:
+        print(__doc__.strip(), file=sys.stderr)
+        return 2
+    print('\n'.join(compare(_load(argv[0]), _load(argv[1]))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,206 @@
+"""
+Fontes falsas locais: Onionoo, check.torproject.org e o MySQL do Cowrie
+
+O servidor MySQL implementa só o necessário do protocolo para o PyMySQL:
+handshake sem TLS (qualquer senha é aceita), ``COM_PING``, ``COM_QUIT`` e
+``COM_QUERY``. A consulta do honeypot devolve as linhas com ``last_view``
+a partir da data informada; qualquer outro comando recebe um OK vazio.
+"""
+
+import bisect
+import hashlib
+import re
+import socketserver
+import struct
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# Capacidades anunciadas: LONG_PASSWORD, FOUND_ROWS, LONG_FLAG, CONNECT_WITH_DB,
+# PROTOCOL_41, TRANSACTIONS, SECURE_CONNECTION, MULTI_RESULTS e PLUGIN_AUTH
+_CAPABILITIES = 0x1 | 0x2 | 0x4 | 0x8 | 0x200 | 0x2000 | 0x8000 | 0x20000 | 0x80000
+_UTF8_GENERAL_CI = 33
+_TYPE_DATETIME = 0x0c
+_TYPE_VAR_STRING = 0xfd
+_COM_QUIT = 0x01
+_COM_QUERY = 0x03
+_COM_PING = 0x0e
+_SINCE = re.compile(r"last_view\s*>=\s*'([^']+)'")
+
+
+class UpstreamServer:
+    """Serve ``/summary``, ``/details`` e ``/exit-addresses`` com ETag e 304"""
+
+    def __init__(self, documents: Dict[str, Tuple[bytes, str]], host: str = '127.0.0.1', port: int = 0):
+        self.documents = {
+            path: (body, content_type, '"%s"' % hashlib.sha256(body).hexdigest()[:16])
+            for path, (body, content_type) in documents.items()
+        }
+        self.hits: Dict[str, int] = {path: 0 for path in documents}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                document = upstream.documents.get(path)
+                if document is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                body, content_type, etag = document
+                upstream.hits[path] += 1
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self) -> 'UpstreamServer':
+        threading.Thread(target=self.server.serve_forever, name='fake-upstream', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _lenenc_int(value: int) -> bytes:
+    if value < 251:
+        return bytes((value,))
+    if value < 1 << 16:
+        return b'\xfc' + struct.pack('<H', value)
+    if value < 1 << 24:
+        return b'\xfd' + struct.pack('<I', value)[:3]
+    return b'\xfe' + struct.pack('<Q', value)
+
+
+def _lenenc_str(value: bytes) -> bytes:
+    return _lenenc_int(len(value)) + value
+
+
+def _column(name: str, column_type: int) -> bytes:
+    """Pacote ColumnDefinition41 da tabela ``urls``"""
+    encoded = name.encode('ascii')
+    return (
+        _lenenc_str(b'def') + _lenenc_str(b'cowrie') + _lenenc_str(b'urls') + _lenenc_str(b'urls')
+        + _lenenc_str(encoded) + _lenenc_str(encoded)
+        + b'\x0c' + struct.pack('<HIBHB', _UTF8_GENERAL_CI, 1024, column_type, 0, 0) + b'\x00\x00'
+    )
+
+
+_OK = b'\x00\x00\x00' + struct.pack('<HH', 0, 0)
+_EOF = b'\xfe' + struct.pack('<HH', 0, 0)
+_COLUMNS = [_lenenc_int(2), _column('url', _TYPE_VAR_STRING), _column('last_view', _TYPE_DATETIME), _EOF]
+
+
+class FakeMySQLServer:
+    """MySQL mínimo servindo ``SELECT url, last_view FROM urls WHERE last_view >= ...``"""
+
+    def __init__(self, rows: List[Tuple[str, datetime]], host: str = '127.0.0.1', port: int = 0):
+        # Linhas pré-codificadas no protocolo texto, na ordem de last_view
+        self.timestamps = [last_view for _, last_view in rows]
+        self.encoded_rows = [
+            _lenenc_str(url.encode('utf-8')) + _lenenc_str(last_view.strftime('%Y-%m-%d %H:%M:%S').encode('ascii'))
+            for url, last_view in rows
+        ]
+        self.queries = 0
+        self.server = socketserver.ThreadingTCPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.server_address[:2]
+
+    def rows_since(self, since: Optional[datetime]) -> List[bytes]:
+        start = 0 if since is None else bisect.bisect_left(self.timestamps, since)
+        return self.encoded_rows[start:]
+
+    def _handler(self):
+        mysql = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def setup(self):
+                self.reader = self.request.makefile('rb')
+
+            def finish(self):
+                self.reader.close()
+
+            def send(self, packets: List[bytes], sequence: int) -> None:
+                out = bytearray()
+                for payload in packets:
+                    out += struct.pack('<I', len(payload))[:3] + bytes((sequence & 0xff,)) + payload
+                    sequence += 1
+                self.request.sendall(out)
+
+            def receive(self) -> Optional[Tuple[int, bytes]]:
+                header = self.reader.read(4)
+                if len(header) < 4:
+                    return None
+                length = header[0] | header[1] << 8 | header[2] << 16
+                return header[3], self.reader.read(length)
+
+            def handle(self):
+                salt = b'12345678abcdefghijkl'
+                greeting = (
+                    b'\x0a' + b'5.7.0-fake\x00' + struct.pack('<I', threading.get_ident() & 0xffffffff)
+                    + salt[:8] + b'\x00' + struct.pack('<H', _CAPABILITIES & 0xffff)
+                    + bytes((_UTF8_GENERAL_CI,)) + struct.pack('<H', 0)
+                    + struct.pack('<H', _CAPABILITIES >> 16) + bytes((21,)) + b'\x00' * 10
+                    + salt[8:] + b'\x00' + b'mysql_native_password\x00'
+                )
+                self.send([greeting], 0)
+                if self.receive() is None:
+                    return
+                self.send([_OK], 2)
+
+                while True:
+                    packet = self.receive()
+                    if packet is None or not packet[1] or packet[1][0] == _COM_QUIT:
+                        return
+                    command, argument = packet[1][0], packet[1][1:]
+                    if command == _COM_QUERY and b'FROM urls' in argument:
+                        self.send(_COLUMNS + mysql.query(argument.decode('utf-8')) + [_EOF], 1)
+                    else:
+                        self.send([_OK], 1)
+
+        return Handler
+
+    def query(self, sql: str) -> List[bytes]:
+        self.queries += 1
+        match = _SINCE.search(sql)
+        since = datetime.fromisoformat(match.group(1)) if match else None
+        return self.rows_since(since)
+
+    def start(self) -> 'FakeMySQLServer':
+        threading.Thread(target=self.server.serve_forever, name='fake-mysql', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,135 @@
+"""
+Geração determinística (por semente) dos payloads das fontes falsas
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+FLAGS = ('Fast', 'Guard', 'HSDir', 'Running', 'Stable', 'V2Dir', 'Valid')
+COUNTRIES = ('de', 'us', 'fr', 'nl', 'se', 'ch', 'ca', 'gb', 'fi', 'ro', 'at', 'pl')
+AS_NAMES = (
+    'Hetzner Online GmbH', 'OVH SAS', 'DigitalOcean, LLC', 'Online S.a.s.',
+    'Linode, LLC', 'Akamai Connected Cloud', 'M247 Europe SRL', 'Frantech Solutions'
+)
+EXIT_POLICIES = (
+    {'accept': ['80', '443']},
+    {'accept': ['20-23', '43', '53', '79-81', '88', '110', '143', '194', '220', '443', '464-465', '531']},
+    {'reject': ['25', '119', '135-139', '445', '563', '1214', '4661-4666', '6346-6429', '6699', '6881-6999']},
+    {'accept': ['1-65535']},
+)
+LEGIT_DOMAINS = ('google.com', 'github.com', 'microsoft.com', 'debian.org')
+
+
+def _ipv4(i: int) -> str:
+    return f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+
+
+def generate_relays(count: int, exits: int, seed: int = 1) -> List[Dict[str, Any]]:
+    """Relays no formato interno do gerador; os ``exits`` primeiros têm a flag Exit"""
+    rng = random.Random(seed)
+    base = datetime(2026, 1, 1)
+    relays = []
+    for i in range(count):
+        flags = [flag for flag in FLAGS if flag in ('Running', 'Valid') or rng.random() < 0.5]
+        if i < exits:
+            flags = sorted(flags + ['Exit'])
+        first_seen = base - timedelta(days=rng.randint(0, 3000), seconds=rng.randint(0, 86399))
+        relays.append({
+            'nickname': f"relay{i}",
+            'fingerprint': '%040X' % rng.getrandbits(160),
+            'ipv4': _ipv4(i + 1),
+            'ipv6': f"2001:db8::{i + 1:x}" if rng.random() < 0.3 else None,
+            'running': 'Running' in flags and rng.random() < 0.95,
+            'flags': flags,
+            'bandwidth': rng.randint(10_000, 100_000_000),
+            'consensus_weight': rng.randint(1, 100_000),
+            'country': rng.choice(COUNTRIES),
+            'as_name': rng.choice(AS_NAMES),
+            'first_seen': first_seen.strftime('%Y-%m-%d %H:%M:%S'),
+            'last_seen': base.strftime('%Y-%m-%d %H:%M:%S'),
+            'exit_policy': rng.choice(EXIT_POLICIES) if i < exits else {'reject': ['1-65535']},
+        })
+    return relays
+
+
+def onionoo_summary(relays: List[Dict[str, Any]]) -> bytes:
+    """Documento ``/summary`` com as chaves lidas por ``TorNodeData``"""
+    documents = [{
+        'n': relay['nickname'],
+        'f': relay['fingerprint'],
+        'a': [relay['ipv4']] + ([relay['ipv6']] if relay['ipv6'] else []),
+        'r': relay['running'],
+        's': relay['flags'],
+        'bw': relay['bandwidth'],
+        'c': relay['country'],
+        'as_name': relay['as_name'],
+        'f_s': relay['first_seen'],
+        'l_s': relay['last_seen'],
+    } for relay in relays]
+    return _onionoo_document(documents)
+
+
+def onionoo_details(relays: List[Dict[str, Any]]) -> bytes:
+    """Documento ``/details`` restrito aos campos pedidos por ``ONIONOO_DETAILS_FIELDS``"""
+    documents = [{
+        'nickname': relay['nickname'],
+        'fingerprint': relay['fingerprint'],
+        'or_addresses': [f"{relay['ipv4']}:9001"] + ([f"[{relay['ipv6']}]:9001"] if relay['ipv6'] else []),
+        'exit_addresses': [relay['ipv4']] if 'Exit' in relay['flags'] else [],
+        'running': relay['running'],
+        'flags': relay['flags'],
+        'advertised_bandwidth': relay['bandwidth'],
+        'country': relay['country'],
+        'as_name': relay['as_name'],
+        'first_seen': relay['first_seen'],
+        'last_seen': relay['last_seen'],
+        'consensus_weight': relay['consensus_weight'],
+        'exit_policy_summary': relay['exit_policy'],
+    } for relay in relays]
+    return _onionoo_document(documents)
+
+
+def _onionoo_document(relays: List[Dict[str, Any]]) -> bytes:
+    return json.dumps({
+        'version': '8.0',
+        'relays_published': '2026-01-01 00:00:00',
+        'relays': relays,
+        'bridges_published': '2026-01-01 00:00:00',
+        'bridges': []
+    }, separators=(',', ':')).encode('utf-8')
+
+
+def exit_addresses(relays: List[Dict[str, Any]]) -> bytes:
+    """Lista no formato de check.torproject.org/exit-addresses"""
+    lines = []
+    for relay in relays:
+        if 'Exit' not in relay['flags']:
+            continue
+        lines.append(f"ExitNode {relay['fingerprint']}")
+        lines.append(f"Published {relay['last_seen']}")
+        lines.append(f"LastStatus {relay['last_seen']}")
+        lines.append(f"ExitAddress {relay['ipv4']} {relay['last_seen']}")
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def honeypot_rows(count: int, seed: int = 1, now: Optional[datetime] = None) -> List[Tuple[str, datetime]]:
+    """Linhas ``(url, last_view)`` da tabela ``urls`` do Cowrie, ordenadas por ``last_view``.
+
+    Cobrem os últimos 35 dias (parte fica fora da janela de 30 dias) e
+    incluem URLs de domínios legítimos, para exercitar a allowlist.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    rows = []
+    for i in range(count):
+        if rng.random() < 0.05:
+            host = f"cdn{i}.{rng.choice(LEGIT_DOMAINS)}"
+        else:
+            host = f"mal{i}.example-{rng.randint(0, 999)}.net"
+        url = f"http://{host}/{rng.choice(('bins', 'x', 'payload', 'sh'))}/{rng.getrandbits(32):08x}"
+        last_view = now - timedelta(seconds=rng.randint(0, 35 * 86400))
+        rows.append((url, last_view.replace(microsecond=0)))
+    rows.sort(key=lambda row: row[1])
+    return rows
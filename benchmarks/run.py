@@ -0,0 +1,402 @@
+"""
+Benchmark de ponta a ponta: fontes falsas locais, gunicorn e carga em todas as rotas
+
+Gera payloads realistas (por padrão 10k relays, 2k exits e 100k URLs), sobe
+o Onionoo, o check.torproject.org e o MySQL do Cowrie falsos, inicia a
+aplicação no gunicorn apontada para eles e mede cada rota: vazão, latência
+(p50/p90/p99) e RSS de cada worker. O resultado é um JSON comparável entre
+commits com ``benchmarks/compare.py``.
+
+Uso, na raiz do repositório::
+
+    python benchmarks/run.py --output base.json
+    python benchmarks/run.py --duration 10 --concurrency 8 --output novo.json
+    python benchmarks/compare.py base.json novo.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from fake_upstream import FakeMySQLServer, UpstreamServer
+from payloads import (
+    LEGIT_DOMAINS,
+    exit_addresses,
+    generate_relays,
+    honeypot_rows,
+    onionoo_details,
+    onionoo_summary,
+)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT_DIR, 'app')
+
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    path: str
+    body: Optional[bytes] = None
+
+
+def build_scenarios(relays: List[Dict[str, Any]]) -> List[Scenario]:
+    """Uma entrada por rota de ``create_routes`` (e variações relevantes)"""
+    exit_ip = next(relay['ipv4'] for relay in relays if 'Exit' in relay['flags'])
+    bulk = '\n'.join(relay['ipv4'] for relay in relays[:1000]).encode('ascii')
+    return [
+        Scenario('index', 'GET', '/'),
+        Scenario('health', 'GET', '/health'),
+        Scenario('metrics', 'GET', '/metrics'),
+        Scenario('robots', 'GET', '/robots.txt'),
+        Scenario('sitemap', 'GET', '/sitemap.xml'),
+        Scenario('tornodes_ip', 'GET', '/tornodes-ip.txt'),
+        Scenario('exit_diff_full', 'GET', '/api/exit-nodes/diff'),
+        Scenario('exit_diff_since', 'GET', '/api/exit-nodes/diff?since=1'),
+        Scenario('honeypot_urls', 'GET', '/honeypot-urls.txt'),
+        Scenario('status', 'GET', '/status'),
+        Scenario('nodes', 'GET', '/api/nodes'),
+        Scenario('nodes_page', 'GET', '/api/nodes?limit=500&fields=fingerprint,nickname,country,flags'),
+        Scenario('nodes_running', 'GET', '/api/nodes/running'),
+        Scenario('nodes_query', 'GET', '/api/nodes/query?country=de,nl&flag=Exit&min_bandwidth=1000000'),
+        Scenario('stats', 'GET', '/api/stats'),
+        Scenario('check_ip', 'GET', f'/api/check/{exit_ip}'),
+        Scenario('check_bulk_1000', 'POST', '/api/check', bulk),
+        Scenario('feed_rss', 'GET', '/api/feed/rss'),
+    ]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _git_revision() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentil por posto mais próximo"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def worker_pids(master_pid: int) -> List[int]:
+    """PIDs dos workers do gunicorn (filhos do master), via /proc"""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # O nome do processo (campo 2) pode conter espaços: o ppid vem após o ')'
+        if int(stat.rsplit(')', 1)[1].split()[1]) == master_pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class AppServer:
+    """Aplicação rodando no gunicorn, apontada para as fontes falsas"""
+
+    def __init__(self, args: argparse.Namespace, upstream: UpstreamServer, mysql: FakeMySQLServer):
+        self.args = args
+        self.port = _free_port()
+        self.cache_dir = tempfile.mkdtemp(prefix='tor-bench-')
+        self.log_path = os.path.join(self.cache_dir, 'gunicorn.log')
+        db_host, db_port = mysql.address
+        self.env = {
+            **os.environ,
+            'CACHE_DIR': self.cache_dir,
+            'ONIONOO_URL': upstream.url,
+            'EXIT_ADDRESSES_URL': f"{upstream.url}/exit-addresses",
+            'ONIONOO_DETAILS': 'true' if args.details else 'false',
+            'DB_HOST': db_host,
+            'DB_PORT': str(db_port),
+            'DB_USER': 'cowrie',
+            'DB_PASSWORD': 'cowrie',
+            'DB_NAME': 'cowrie',
+            'LEGIT_DOMAINS': ','.join(LEGIT_DOMAINS),
+            'RATELIMIT_ENABLED': 'false',
+            'LOG_LEVEL': 'WARNING',
+            'GUNICORN_PRELOAD': 'false' if args.no_preload else 'true',
+            'PYTHONUNBUFFERED': '1',
+        }
+        self.process: Optional[subprocess.Popen] = None
+        self._log = None
+
+    def start(self) -> None:
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            '--config', os.path.join(APP_DIR, 'gunicorn.conf.py'),
+            '--chdir', APP_DIR,
+            '--bind', f"127.0.0.1:{self.port}",
+            '--workers', str(self.args.workers),
+            '--timeout', '120',
+            '--log-level', 'warning',
+            *self.args.gunicorn_arg,
+            'main:app',
+        ]
+        self._log = open(self.log_path, 'ab')
+        self.process = subprocess.Popen(command, env=self.env, stdout=self._log, stderr=subprocess.STDOUT)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None, timeout: float = 60) -> tuple:
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=timeout)
+        try:
+            headers = {'Accept-Encoding': self.args.accept_encoding, 'Connection': 'close'}
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def wait_ready(self, relays: int, exits: int, timeout: float) -> None:
+        """Espera os workers servirem os snapshots completos das duas fontes"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn terminou (código {self.process.returncode}); veja {self.log_path}")
+            try:
+                status, body = self.request('GET', '/status', timeout=5)
+                info = json.loads(body) if status == 200 else {}
+                if info.get('total_detailed_nodes', 0) >= relays and info.get('ip_count', 0) >= exits:
+                    return
+            except (OSError, ValueError, http.client.HTTPException):
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Aplicação não ficou pronta em {timeout:.0f}s; veja {self.log_path}")
+
+    def worker_rss(self) -> Dict[int, Optional[int]]:
+        return {pid: rss_kb(pid) for pid in worker_pids(self.process.pid)}
+
+    def stop(self) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._log:
+            self._log.close()
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+def run_scenario(server: AppServer, scenario: Scenario, args: argparse.Namespace) -> Dict[str, Any]:
+    """Aquece a rota e a mede com ``concurrency`` clientes por ``duration`` segundos"""
+    for _ in range(args.warmup):
+        server.request(scenario.method, scenario.path, scenario.body)
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    errors = Counter()
+    transferred = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def client() -> None:
+        local_latencies, local_statuses, local_errors, local_bytes = [], Counter(), Counter(), 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status, body = server.request(scenario.method, scenario.path, scenario.body)
+            except (OSError, http.client.HTTPException) as e:
+                local_errors[type(e).__name__] += 1
+                continue
+            local_latencies.append(time.perf_counter() - start)
+            local_statuses[status] += 1
+            local_bytes += len(body)
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+            errors.update(local_errors)
+            transferred[0] += local_bytes
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    requests = len(latencies)
+    failed = sum(count for status, count in statuses.items() if status >= 400) + sum(errors.values())
+    return {
+        'name': scenario.name,
+        'method': scenario.method,
+        'path': scenario.path,
+        'requests': requests,
+        'errors': failed,
+        'status': {str(status): count for status, count in sorted(statuses.items())},
+        'exceptions': dict(errors),
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / requests * 1000, 3) if requests else 0.0,
+            'p50': round(_percentile(latencies, 0.50) * 1000, 3),
+            'p90': round(_percentile(latencies, 0.90) * 1000, 3),
+            'p99': round(_percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        'bytes_per_request': transferred[0] // requests if requests else 0,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--relays', type=int, default=10000, help='relays no documento do Onionoo')
+    parser.add_argument('--exits', type=int, default=2000, help='relays exit (e linhas do exit-addresses)')
+    parser.add_argument('--urls', type=int, default=100000, help='linhas na tabela urls do Cowrie')
+    parser.add_argument('--seed', type=int, default=1, help='semente dos payloads gerados')
+    parser.add_argument('--details', action='store_true', help='usa o documento /details (ONIONOO_DETAILS)')
+    parser.add_argument('--workers', type=int, default=3, help='workers do gunicorn')
+    parser.add_argument('--no-preload', action='store_true', help='desliga o --preload do gunicorn.conf.py')
+    parser.add_argument('--concurrency', type=int, default=4, help='clientes simultâneos por rota')
+    parser.add_argument('--duration', type=float, default=5.0, help='segundos de medição por rota')
+    parser.add_argument('--warmup', type=int, default=10, help='requisições de aquecimento por rota')
+    parser.add_argument('--accept-encoding', default='gzip', help='cabeçalho Accept-Encoding dos clientes')
+    parser.add_argument('--route', action='append', default=[], help='mede só as rotas com esse nome (repetível)')
+    parser.add_argument('--ready-timeout', type=float, default=180.0, help='espera máxima pela aplicação (s)')
+    parser.add_argument('--gunicorn-arg', action='append', default=[], help='argumento extra para o gunicorn')
+    parser.add_argument('--output', default='-', help="arquivo JSON de saída ('-' para stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    log = lambda message: print(message, file=sys.stderr, flush=True)  # noqa: E731
+
+    log(f"Gerando payloads: {args.relays} relays, {args.exits} exits, {args.urls} URLs...")
+    relays = generate_relays(args.relays, args.exits, args.seed)
+    documents = {
+        '/summary': (onionoo_summary(relays), 'application/json'),
+        '/details': (onionoo_details(relays), 'application/json'),
+        '/exit-addresses': (exit_addresses(relays), 'text/plain'),
+    }
+    upstream = UpstreamServer(documents).start()
+    mysql = FakeMySQLServer(honeypot_rows(args.urls, args.seed)).start()
+
+    scenarios = build_scenarios(relays)
+    if args.route:
+        scenarios = [scenario for scenario in scenarios if scenario.name in args.route]
+
+    server = AppServer(args, upstream, mysql)
+    results: Dict[str, Any] = {
+        'meta': {
+            **_git_revision(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        },
+        'payloads': {
+            'relays': args.relays,
+            'exits': args.exits,
+            'urls': args.urls,
+            'onionoo_bytes': len(documents['/details' if args.details else '/summary'][0]),
+            'exit_addresses_bytes': len(documents['/exit-addresses'][0]),
+        },
+    }
+
+    try:
+        started = time.perf_counter()
+        server.start()
+        server.wait_ready(args.relays, args.exits, args.ready_timeout)
+        results['startup_seconds'] = round(time.perf_counter() - started, 3)
+        log(f"Aplicação pronta em {results['startup_seconds']}s (porta {server.port})")
+
+        rss = {pid: {'startup': value, 'peak': value} for pid, value in server.worker_rss().items()}
+        routes = []
+        for scenario in scenarios:
+            result = run_scenario(server, scenario, args)
+            routes.append(result)
+            log(
+                f"{scenario.name:<18} {result['throughput_rps']:>9.1f} req/s  "
+                f"p50 {result['latency_ms']['p50']:>8.2f} ms  p99 {result['latency_ms']['p99']:>8.2f} ms  "
+                f"erros {result['errors']}"
+            )
+            for pid, value in server.worker_rss().items():
+                entry = rss.setdefault(pid, {'startup': None, 'peak': value})
+                if value is not None and (entry['peak'] is None or value > entry['peak']):
+                    entry['peak'] = value
+
+        final = server.worker_rss()
+        results['routes'] = routes
+        results['workers'] = [
+            {'pid': pid, 'rss_kb': {**values, 'final': final.get(pid)}}
+            for pid, values in sorted(rss.items())
+        ]
+        results['upstream'] = {'http_hits': dict(upstream.hits), 'mysql_queries': mysql.queries}
+
+        # Reinício com os snapshots já persistidos em CACHE_DIR
+        server.stop()
+        started = time.perf_counter()
+        server.start()
+        server.wait_ready(args.relays, args.exits, args.ready_timeout)
+        results['warm_restart_seconds'] = round(time.perf_counter() - started, 3)
+        log(f"Reinício com snapshot persistido pronto em {results['warm_restart_seconds']}s")
+    except RuntimeError:
+        server.stop()
+        with open(server.log_path, 'rb') as f:
+            log(f.read()[-4000:].decode('utf-8', 'replace'))
+        raise
+    finally:
+        server.stop()
+        upstream.stop()
+        mysql.stop()
+        server.cleanup()
+
+    payload = json.dumps(results, indent=2, sort_keys=False)
+    if args.output == '-':
+        print(payload)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(payload + '\n')
+        log(f"Resultado gravado em {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from services.stream_parsers import iter_onionoo_relays  # noqa: E402
+
+
+def onionoo_document(count):
+    relays = [{'n': f'relay{i}', 'f': '%040X' % i, 'a': [f'10.0.{i // 256}.{i % 256}']} for i in range(count)]
+    return json.dumps({'version': '8.0', 'relays': relays, 'bridges': []}).encode()
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class IterOnionooRelaysTest(unittest.TestCase):
+
+    def test_small_chunks(self):
+        data = onionoo_document(50)
+        relays = list(iter_onionoo_relays(split(data, 7)))
+        self.assertEqual([relay['n'] for relay in relays], [f'relay{i}' for i in range(50)])
+
+    def test_single_large_chunk(self):
+        data = onionoo_document(2000)
+        self.assertGreater(len(data), 65536)
+        relays = list(iter_onionoo_relays([data]))
+        self.assertEqual(len(relays), 2000)
+
+    def test_key_after_large_prefix(self):
+        # A chave só aparece depois de mais de 64K de outros campos
+        prefix = json.dumps({'version': '8.0', 'padding': 'x' * 100000})[:-1]
+        data = (prefix + ', "relays": [{"n": "a"}, {"n": "b"}]}').encode()
+        self.assertEqual([relay['n'] for relay in iter_onionoo_relays([data])], ['a', 'b'])
+        self.assertEqual([relay['n'] for relay in iter_onionoo_relays(split(data, 70000))], ['a', 'b'])
+
+    def test_key_split_across_chunks(self):
+        data = b'{"version": "8.0", "rel' + b'ays"  :  [{"n": "a"}]}'
+        chunks = [data[:22], data[22:]]
+        self.assertEqual([relay['n'] for relay in iter_onionoo_relays(chunks)], ['a'])
+
+    def test_missing_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_onionoo_relays([b'{"version": "8.0", "bridges": []}']))
+
+
+if __name__ == '__main__':
+    unittest.main()